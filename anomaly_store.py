@@ -0,0 +1,271 @@
+"""
+Sorted, partitioned Parquet store of scored anomalies for the Streamlit app.
+
+Layout: <store>/agency=<name>/part-0.parquet, each file sorted by amount and
+written in row groups of ROW_GROUP_SIZE rows. An agency filter only opens the
+selected directories and an amount range only reads the row groups whose
+min/max statistics overlap it, so queries touch a fraction of the data.
+
+The build also stores a fine amount histogram per agency (_histograms.npz).
+Charts for any filter selection are drawn from those counts instead of the
+rows.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from urllib.parse import quote
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from data_io import CHUNKSIZE, iter_chunks, partition_files, table_path
+
+STORE_DIR = 'anomalies_store'
+META_FILE = '_meta.json'
+HISTOGRAM_FILE = '_histograms.npz'
+PARTITION_COLUMN = 'agency'
+SORT_COLUMN = 'amount'
+
+# Rows per row group; smaller groups let amount ranges skip more precisely
+ROW_GROUP_SIZE = 64_000
+
+# Rows per page of the Streamlit table
+PAGE_SIZE = 1000
+
+# Fine amount bins per agency histogram, log-spaced when all amounts are positive
+HISTOGRAM_BINS = 4096
+
+
+def source_files(source):
+    return partition_files(source) if os.path.isdir(source) else [source]
+
+
+def source_version(source):
+    """Identifies one state of the source table (paths, sizes and modification times)."""
+    digest = hashlib.sha256()
+    for path in source_files(source):
+        stat = os.stat(path)
+        digest.update(f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()[:16]
+
+
+def load_meta(store_dir=STORE_DIR):
+    path = os.path.join(store_dir, META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def is_stale(store_dir, source):
+    """True if the store is missing or was built from a different version of source."""
+    meta = load_meta(store_dir)
+    return (meta is None or meta['version'] != source_version(source) or
+            not os.path.exists(os.path.join(store_dir, HISTOGRAM_FILE)))
+
+
+def histogram_edges(amount_min, amount_max, bins=HISTOGRAM_BINS):
+    if amount_max <= amount_min:
+        amount_max = amount_min + 1
+    if amount_min > 0:
+        return np.geomspace(amount_min, amount_max, bins + 1)
+    return np.linspace(amount_min, amount_max, bins + 1)
+
+
+def build_store(source, store_dir=STORE_DIR, chunksize=CHUNKSIZE, row_group_size=ROW_GROUP_SIZE):
+    """
+    Build the store from a CSV/Parquet file (or partitioned table directory).
+
+    The source is streamed in chunks and split into one staging file per
+    agency, then each agency is sorted by amount on its own, so memory is
+    bounded by the largest agency rather than the whole table. The store is
+    assembled next to store_dir and swapped in at the end.
+    Returns the store metadata.
+    """
+    tmp_dir = store_dir.rstrip('/') + '.tmp'
+    staging = os.path.join(tmp_dir, '_staging')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(staging)
+
+    writers, schema, columns = {}, None, None
+    amount_min, amount_max = np.inf, -np.inf
+    try:
+        for path in source_files(source):
+            for chunk in iter_chunks(path, chunksize, parse_dates=['payment_date']):
+                if columns is None:
+                    columns = list(chunk.columns)
+                if chunk[SORT_COLUMN].notna().any():
+                    amount_min = min(amount_min, chunk[SORT_COLUMN].min())
+                    amount_max = max(amount_max, chunk[SORT_COLUMN].max())
+                for value, part in chunk.groupby(PARTITION_COLUMN, observed=True, sort=False):
+                    table = pa.Table.from_pandas(part.drop(columns=PARTITION_COLUMN), preserve_index=False)
+                    if schema is None:
+                        schema = table.schema
+                    else:
+                        table = table.cast(schema)
+                    if value not in writers:
+                        writers[value] = pq.ParquetWriter(os.path.join(staging, f'{len(writers)}.parquet'), schema)
+                    writers[value].write_table(table)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    edges = histogram_edges(amount_min, amount_max) if np.isfinite(amount_min) else histogram_edges(0, 1)
+    partitions, histograms = {}, {}
+    for i, value in enumerate(writers):
+        table = pq.read_table(os.path.join(staging, f'{i}.parquet')).sort_by(SORT_COLUMN)
+        directory = os.path.join(tmp_dir, f'{PARTITION_COLUMN}={quote(str(value), safe="")}')
+        os.makedirs(directory)
+        pq.write_table(table, os.path.join(directory, 'part-0.parquet'), row_group_size=row_group_size)
+        amount_range = pc.min_max(table[SORT_COLUMN])
+        partitions[str(value)] = {
+            'rows': table.num_rows,
+            'amount_min': amount_range['min'].as_py(),
+            'amount_max': amount_range['max'].as_py(),
+        }
+        amounts = table[SORT_COLUMN].to_numpy(zero_copy_only=False).astype(np.float64)
+        histograms[str(value)] = np.histogram(amounts[~np.isnan(amounts)], bins=edges)[0]
+    shutil.rmtree(staging)
+
+    names = sorted(histograms)
+    np.savez(os.path.join(tmp_dir, HISTOGRAM_FILE), edges=edges, agencies=np.array(names, dtype=str),
+             counts=np.array([histograms[name] for name in names], dtype=np.int64).reshape(len(names), len(edges) - 1))
+
+    meta = {
+        'version': source_version(source),
+        'source': source,
+        'columns': columns or [],
+        'rows': sum(p['rows'] for p in partitions.values()),
+        'partitions': dict(sorted(partitions.items())),
+    }
+    with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.replace(tmp_dir, store_dir)
+    return meta
+
+
+class AnomalyStore:
+    """
+    Read side of the store. Filters are pyarrow dataset expressions, so the
+    agency selection prunes partitions and the amount range prunes row
+    groups before any data is decoded.
+    """
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.meta = load_meta(store_dir)
+        if self.meta is None:
+            raise FileNotFoundError(f"No anomaly store in {store_dir!r}; run anomaly_store.py first")
+        self.version = self.meta['version']
+        self.dataset = ds.dataset(store_dir, format='parquet', partitioning='hive')
+
+        with np.load(os.path.join(store_dir, HISTOGRAM_FILE)) as summary:
+            self.edges = summary['edges']
+            self.histograms = dict(zip(summary['agencies'].tolist(), summary['counts']))
+
+    @property
+    def agencies(self):
+        return list(self.meta['partitions'])
+
+    @property
+    def amount_range(self):
+        partitions = self.meta['partitions'].values()
+        if not partitions:
+            return 0.0, 0.0
+        return (min(p['amount_min'] for p in partitions),
+                max(p['amount_max'] for p in partitions))
+
+    def histogram(self, agencies, amount_min, amount_max):
+        """
+        (bin centres, counts) of the selection, merged from the per-agency
+        histograms. A fine bin counts if its centre lies in the amount range.
+        """
+        centres = (self.edges[:-1] + self.edges[1:]) / 2
+        counts = np.zeros(len(centres), dtype=np.int64)
+        for agency in agencies:
+            if agency in self.histograms:
+                counts += self.histograms[agency]
+        counts[(centres < amount_min) | (centres > amount_max)] = 0
+        return centres, counts
+
+    def filter(self, agencies, amount_min, amount_max):
+        # Typed explicitly so an empty selection is still a string set
+        selected = pa.array([str(agency) for agency in agencies], type=pa.string())
+        return (ds.field(PARTITION_COLUMN).isin(selected) &
+                (ds.field(SORT_COLUMN) >= amount_min) &
+                (ds.field(SORT_COLUMN) <= amount_max))
+
+    def count(self, agencies, amount_min, amount_max):
+        return self.dataset.count_rows(filter=self.filter(agencies, amount_min, amount_max))
+
+    def _to_frame(self, table):
+        df = table.to_pandas()
+        return df[[c for c in self.meta['columns'] if c in df.columns]]
+
+    def read(self, agencies, amount_min, amount_max, columns=None):
+        """All matching rows, limited to `columns`."""
+        table = self.dataset.to_table(columns=columns, filter=self.filter(agencies, amount_min, amount_max))
+        return self._to_frame(table)
+
+    def page(self, agencies, amount_min, amount_max, page=0, page_size=PAGE_SIZE):
+        """
+        Rows page * page_size up to the next page_size of the matching rows,
+        in store order (agency, then amount). Batches are streamed and the
+        scan stops once the page is full.
+        """
+        scanner = self.dataset.scanner(filter=self.filter(agencies, amount_min, amount_max))
+        skip, batches, remaining = page * page_size, [], page_size
+        for batch in scanner.to_batches():
+            if skip >= batch.num_rows:
+                skip -= batch.num_rows
+                continue
+            batch = batch.slice(skip, remaining)
+            skip = 0
+            batches.append(batch)
+            remaining -= batch.num_rows
+            if remaining <= 0:
+                break
+        return self._to_frame(pa.Table.from_batches(batches, schema=scanner.projected_schema))
+
+
+def box_stats(centres, counts, label=None):
+    """
+    Box plot statistics (matplotlib bxp format) from a histogram: quartiles
+    by interpolating the cumulative counts, whiskers at the most extreme
+    bins within 1.5 IQR. Outlier points are not kept in the summary.
+    """
+    present = counts > 0
+    centres, counts = centres[present], counts[present]
+    if not len(counts):
+        return None
+    cumulative = np.cumsum(counts) - counts / 2
+    q1, med, q3 = np.interp(np.array([0.25, 0.5, 0.75]) * counts.sum(), cumulative, centres)
+    iqr = q3 - q1
+    inside = centres[(centres >= q1 - 1.5 * iqr) & (centres <= q3 + 1.5 * iqr)]
+    return {'label': label, 'q1': q1, 'med': med, 'q3': q3,
+            'whislo': inside.min(), 'whishi': inside.max(), 'fliers': []}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the sorted, partitioned anomaly store for streamlit_app.py")
+    parser.add_argument('--input', default=None,
+                        help="Scored transactions (default: anomalies_detected.parquet/.csv in the current directory)")
+    parser.add_argument('--store', default=STORE_DIR, help="Store directory to (re)build")
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help="Rows per streamed chunk")
+    parser.add_argument('--row-group-size', type=int, default=ROW_GROUP_SIZE, help="Rows per Parquet row group")
+    args = parser.parse_args()
+
+    source = args.input or table_path('.', 'anomalies_detected')
+    print(f"📦 Building anomaly store from {source}...")
+    meta = build_store(source, args.store, args.chunksize, args.row_group_size)
+    print(f"✅ {meta['rows']:,} rows in {len(meta['partitions'])} agency partitions written to {args.store}/")
+
+
+if __name__ == '__main__':
+    main()
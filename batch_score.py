@@ -0,0 +1,181 @@
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from data_io import ChunkWriter, CHUNKSIZE, is_parquet
+from features import DATE_COLUMN
+from forest_evaluator import CASCADE_MARGIN, CascadedForest, cascade_stats, get_flat_forest
+from scoring import score_chunk, RAW_DTYPES
+import model_store
+
+# Target size of one CSV work unit; small enough to balance 32 workers on a
+# few-GB file, large enough that per-task overhead is negligible
+RANGE_BYTES = 64 * 1024 * 1024
+
+# Per-process model, loaded once by the pool initializer. Memory-mapped, so
+# all workers share the artifact's arrays through the page cache.
+_model = None
+_encoder = None
+
+
+def _init_worker(model_dir, version, cascade_trees=0, cascade_margin=CASCADE_MARGIN):
+    global _model, _encoder
+    _model, metadata = model_store.load_model(model_dir, version, mmap_mode='r')
+    _encoder = model_store.load_encoder(metadata)
+    if cascade_trees:
+        _model = CascadedForest(get_flat_forest(_model, model_dir, metadata['version']),
+                                cascade_trees, cascade_margin)
+
+
+def csv_ranges(path, range_bytes=RANGE_BYTES):
+    """
+    Split a CSV into [start, end) byte ranges that begin and end on line
+    boundaries. Returns (header_names, ranges).
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        data_start = f.tell()
+        boundaries = [data_start]
+        position = data_start + range_bytes
+        while position < size:
+            f.seek(position)
+            f.readline()  # finish the line that straddles the cut
+            if f.tell() >= size:
+                break
+            boundaries.append(f.tell())
+            position = f.tell() + range_bytes
+        boundaries.append(size)
+    names = header.decode().strip().split(',')
+    ranges = [(s, e) for s, e in zip(boundaries[:-1], boundaries[1:]) if e > s]
+    return names, ranges
+
+
+def _iter_task_chunks(path, task, names, chunksize):
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, row_groups=[task]):
+            yield batch.to_pandas().astype({k: v for k, v in RAW_DTYPES.items() if k in batch.schema.names})
+    else:
+        start, end = task
+        with open(path, 'rb') as f:
+            f.seek(start)
+            buffer = io.BytesIO(f.read(end - start))
+        parse_dates = [DATE_COLUMN] if DATE_COLUMN in names else None
+        yield from pd.read_csv(buffer, header=None, names=names, dtype=RAW_DTYPES,
+                               parse_dates=parse_dates, chunksize=chunksize)
+
+
+def _score_task(args):
+    """
+    Score one row range into its own part file; returns (part_path, rows,
+    anomalies, rows_full), rows_full being the rows a cascade scored on every tree.
+    """
+    path, task, names, part_path, chunksize, anomalies_only = args
+    rows = anomalies = 0
+    counts_before = _model.counts() if isinstance(_model, CascadedForest) else (0, 0)
+    with ChunkWriter(part_path) as writer:
+        for chunk in _iter_task_chunks(path, task, names, chunksize):
+            scored = score_chunk(_model, _encoder, chunk)
+            flagged = scored['is_anomaly'] == 'Anomaly'
+            rows += len(scored)
+            anomalies += int(flagged.sum())
+            writer.write(scored[flagged] if anomalies_only else scored)
+    rows_full = _model.counts()[1] - counts_before[1] if isinstance(_model, CascadedForest) else rows
+    return part_path, rows, anomalies, rows_full
+
+
+def score_parallel(path, output, model_dir=model_store.MODEL_DIR, version=None, workers=None,
+                   chunksize=CHUNKSIZE, anomalies_only=True, range_bytes=RANGE_BYTES,
+                   cascade_trees=0, cascade_margin=CASCADE_MARGIN):
+    """
+    Score a CSV or Parquet file in a process pool and write the results to
+    `output` in the anomalies_detected.csv layout.
+
+    The input is split into row ranges: byte ranges on line boundaries for
+    CSV, row groups for Parquet. Each worker scores its ranges into part
+    files. The parent appends finished parts to `output` in input order, so
+    the output is written incrementally and peak memory stays at a few
+    ranges per worker. Returns (rows, anomalies).
+
+    cascade_trees > 0 scores with a CascadedForest (IsolationForest models
+    only): rows whose estimate from the first cascade_trees trees is at
+    least cascade_margin from the threshold are not scored further.
+    """
+    if cascade_trees:
+        metadata = model_store.load_metadata(model_dir, version)
+        if metadata.get('model_class') != 'IsolationForest':
+            raise ValueError(f"--cascade-trees only works with IsolationForest models, "
+                             f"model {metadata['version']} is a {metadata.get('model_class')}")
+    workers = workers or os.cpu_count()
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        names, tasks = None, list(range(pq.ParquetFile(path).num_row_groups))
+    else:
+        names, tasks = csv_ranges(path, range_bytes)
+    
+    part_dir = tempfile.mkdtemp(prefix='batch_score_', dir=os.path.dirname(os.path.abspath(output)))
+    part_ext = '.parquet' if is_parquet(output) else '.csv'
+    jobs = [(path, task, names, os.path.join(part_dir, f'part-{i:06d}{part_ext}'), chunksize, anomalies_only)
+            for i, task in enumerate(tasks)]
+    
+    rows = anomalies = rows_full = 0
+    initargs = (model_dir, version, cascade_trees, cascade_margin)
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as pool, \
+                ChunkWriter(output) as writer:
+            # map() yields in submission order, so parts are appended in input order
+            for part_path, part_rows, part_anomalies, part_rows_full in pool.map(_score_task, jobs):
+                rows += part_rows
+                anomalies += part_anomalies
+                rows_full += part_rows_full
+                writer.append_file(part_path, part_rows if not anomalies_only else part_anomalies)
+                os.remove(part_path)
+                print(f"  scored {rows:,} rows")
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+    if cascade_trees:
+        n_estimators = model_store.load_metadata(model_dir, version)['params']['n_estimators']
+        stats = cascade_stats(rows, rows_full, cascade_trees, n_estimators, cascade_margin)
+        print(f"🪜 {stats['early_exit_rate']:.1%} of rows exited after {cascade_trees} trees, "
+              f"saving {stats['tree_evaluations_saved']:.1%} of tree evaluations")
+    return rows, anomalies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV/Parquet file of transactions on all cores")
+    parser.add_argument('input', help="Raw transactions (agency, recipient_type, amount, payment_date)")
+    parser.add_argument('--output', default='anomalies_detected.csv',
+                        help="Scored output, CSV or Parquet (default: anomalies_detected.csv)")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: all cores)")
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help="Rows scored per model call")
+    parser.add_argument('--range-mb', type=int, default=RANGE_BYTES // (1024 * 1024),
+                        help="Size of one CSV work unit in MB")
+    parser.add_argument('--all-rows', action='store_true', help="Write normal rows too, not only anomalies")
+    parser.add_argument('--cascade-trees', type=int, default=0,
+                        help="Early-exit scoring: trees every row is scored on before it may stop (0: all)")
+    parser.add_argument('--cascade-margin', type=float, default=CASCADE_MARGIN,
+                        help="Distance from the anomaly threshold a row's estimate needs to stop early")
+    parser.add_argument('--model-dir', default=model_store.MODEL_DIR)
+    parser.add_argument('--version', help="Model version (default: LATEST)")
+    args = parser.parse_args(argv)
+    
+    print(f"Scoring {args.input} with {args.workers or os.cpu_count()} workers...")
+    start = time.perf_counter()
+    rows, anomalies = score_parallel(args.input, args.output, args.model_dir, args.version, args.workers,
+                                     args.chunksize, not args.all_rows, args.range_mb * 1024 * 1024,
+                                     args.cascade_trees, args.cascade_margin)
+    elapsed = time.perf_counter() - start
+    
+    print(f"\n✅ Scored {rows:,} transactions in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    print(f"📊 {anomalies:,} anomalies written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Time and memory-profile every pipeline stage at several data sizes and
+write the results as JSON, to compare across commits.
+
+    python benchmarks/run_benchmarks.py --sizes 10000,100000,1000000
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/old.json benchmarks/results/new.json
+
+Stages, in pipeline order, each reading what the previous one wrote in
+<work-dir>/<size>/:
+
+    generate    synthetic_data.write_transactions -> transactions.parquet (1% injected anomalies)
+    train       train_model.train_chunked + model_store.save_model -> models/
+    score       batch_score.score_parallel, all rows -> anomalies_detected.parquet
+    explain     explain.explain_file (SHAP for the flagged rows) -> explanations/
+    powerbi     powerbi_data_preparation.prepare_powerbi_data -> powerbi_data/
+    dashboard   create_html_dashboard.build_dashboard (no figure cache) -> dashboard.html
+
+Each stage runs in a fresh process, so its peak RSS is its own and not the
+high-water mark of earlier stages. Worker processes (batch_score) are
+reported separately as children_peak_rss_mb.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+STAGES = ['generate', 'train', 'score', 'explain', 'powerbi', 'dashboard']
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# Share of generated rows with an injected amount anomaly
+ANOMALY_RATE = 0.01
+
+# Reservoir sample the model is fitted on (train_chunked)
+SAMPLE_SIZE = 100_000
+
+
+def _rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident memory of this process (or of its largest child) in MB."""
+    if who == resource.RUSAGE_SELF and os.path.exists('/proc/self/status'):
+        # ru_maxrss survives exec on Linux, so a spawned process would start
+        # at the launcher's peak; VmHWM is reset for the new program
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _count(path):
+    from data_io import count_rows
+    return count_rows(path)
+
+
+def stage_generate(size, options):
+    from synthetic_data import write_transactions
+    rows = write_transactions('transactions.parquet', size, options['chunksize'], anomaly_rate=ANOMALY_RATE)
+    return {'rows': rows}
+
+
+def stage_train(size, options):
+    import model_store
+    from train_model import train_chunked
+    model, encoder, background, n_rows, n_sampled = train_chunked(
+        'transactions.parquet', options['chunksize'], SAMPLE_SIZE)
+    model_store.save_model(model, encoder, {'training_source': 'benchmark', 'n_samples': n_rows},
+                           model_dir='models', version='benchmark', background=background)
+    return {'rows': n_rows, 'rows_fitted': n_sampled}
+
+
+def stage_score(size, options):
+    from batch_score import score_parallel
+    score_parallel('transactions.parquet', 'anomalies_detected.parquet', model_dir='models',
+                   workers=options['workers'], chunksize=options['chunksize'], anomalies_only=False)
+    return {'rows': _count('anomalies_detected.parquet')}
+
+
+def stage_explain(size, options):
+    from explain import explain_file
+    explained = explain_file('anomalies_detected.parquet', model_dir='models', chunksize=options['chunksize'])
+    return {'rows': explained}
+
+
+def stage_powerbi(size, options):
+    from powerbi_data_preparation import prepare_powerbi_data
+    stats = prepare_powerbi_data('anomalies_detected.parquet', 'powerbi_data', formats=(options['format'],))
+    return {'rows': size, 'anomalies': int(stats['anomalies_detected'])}
+
+
+def stage_dashboard(size, options):
+    from create_html_dashboard import build_dashboard
+    summary = build_dashboard(data_dir='powerbi_data', output_file='dashboard.html', use_cache=False)
+    return {'rows': summary['rows'], 'html_mb': round(os.path.getsize('dashboard.html') / 1e6, 2)}
+
+
+STAGE_FUNCTIONS = {
+    'generate': stage_generate,
+    'train': stage_train,
+    'score': stage_score,
+    'explain': stage_explain,
+    'powerbi': stage_powerbi,
+    'dashboard': stage_dashboard,
+}
+
+
+def _run_stage(stage, size, work_dir, options):
+    """Runs in a fresh process: time one stage, then report its peak memory."""
+    os.chdir(work_dir)
+    baseline_mb = _rss_mb()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        result = STAGE_FUNCTIONS[stage](size, options)
+    seconds = time.perf_counter() - start
+    return {
+        'stage': stage,
+        'size': size,
+        'seconds': round(seconds, 4),
+        'rows_per_second': round(result.get('rows', size) / seconds, 1) if seconds else None,
+        'peak_rss_mb': round(_rss_mb(), 1),
+        'baseline_rss_mb': round(baseline_mb, 1),
+        'children_peak_rss_mb': round(_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        **result,
+    }
+
+
+def run_stage(stage, size, work_dir, options):
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(_run_stage, stage, size, work_dir, options).result()
+
+
+def environment():
+    import numpy, pandas, pyarrow, sklearn
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'packages': {module.__name__: module.__version__ for module in (numpy, pandas, pyarrow, sklearn)},
+    }
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, stages=STAGES, work_dir=None, keep=False, **options):
+    """
+    Run `stages` at every size and return the results document. Later
+    stages need the outputs of earlier ones, so a subset must still start
+    from generate unless work_dir already holds them.
+    """
+    options = {'chunksize': 500_000, 'workers': None, 'format': 'csv', **options}
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='benchmark-')
+    document = {**environment(), 'options': options, 'results': []}
+    try:
+        for size in sizes:
+            size_dir = os.path.abspath(os.path.join(work_dir, str(size)))
+            os.makedirs(size_dir, exist_ok=True)
+            for stage in stages:
+                result = run_stage(stage, size, size_dir, options)
+                document['results'].append(result)
+                print(f"  {size:>12,} {stage:<10} {result['seconds']:9.2f}s "
+                      f"{result['peak_rss_mb']:9.0f} MB", flush=True)
+    finally:
+        if own_dir and not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return document
+
+
+def compare(old_path, new_path):
+    """Print new/old time and memory ratios for every (size, stage) in both files."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    old_results = {(r['size'], r['stage']): r for r in old['results']}
+    print(f"{'size':>12} {'stage':<10} {'old s':>9} {'new s':>9} {'time':>7} {'old MB':>8} {'new MB':>8} {'mem':>7}")
+    for r in new['results']:
+        o = old_results.get((r['size'], r['stage']))
+        if o is None:
+            continue
+        print(f"{r['size']:>12,} {r['stage']:<10} {o['seconds']:9.2f} {r['seconds']:9.2f} "
+              f"{r['seconds'] / max(o['seconds'], 1e-9):6.2f}x {o['peak_rss_mb']:8.0f} {r['peak_rss_mb']:8.0f} "
+              f"{r['peak_rss_mb'] / max(o['peak_rss_mb'], 1e-9):6.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma-separated row counts")
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f"Comma-separated subset of {','.join(STAGES)}")
+    parser.add_argument('--chunksize', type=int, default=500_000, help="Rows per chunk for streaming stages")
+    parser.add_argument('--workers', type=int, help="batch_score worker processes (default: all cores)")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help="Power BI table format")
+    parser.add_argument('--work-dir', help="Keep the generated data here (default: a temporary directory)")
+    parser.add_argument('--keep', action='store_true', help="Don't delete the temporary work directory")
+    parser.add_argument('--output', help="Results JSON (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare two results files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    stages = args.stages.split(',')
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    print(f"⏱️  Benchmarking {', '.join(stages)} at {', '.join(f'{s:,}' for s in sizes)} rows")
+    document = run_benchmarks(sizes, stages, args.work_dir, args.keep,
+                              chunksize=args.chunksize, workers=args.workers, format=args.format)
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{(document['commit'] or 'nogit')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2)
+    print(f"\n✅ Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
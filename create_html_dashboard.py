@@ -1,25 +1,41 @@
+import argparse
+import base64
+import hashlib
+import html
+import json
+import numpy as np
 import pandas as pd
+import plotly
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import plotly.express as px
+from plotly.utils import PlotlyJSONEncoder
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import os
+import re
+import shutil
 
-print("📊 Creating Financial Anomaly Detection Dashboard...")
-print("=" * 60)
+from data_io import read_table
+from schema import CSV_DTYPES, compact_frame
+from powerbi_data_preparation import frame_from_details, partial_aggregates, summary_tables
 
-# Load all data files
-print("Loading data files...")
-anomaly_details = pd.read_csv('powerbi_data/anomaly_details.csv')
-exec_metrics = pd.read_csv('powerbi_data/executive_metrics.csv')
-time_series = pd.read_csv('powerbi_data/time_series.csv')
-entity_summary = pd.read_csv('powerbi_data/entity_summary.csv')
-heatmap_data = pd.read_csv('powerbi_data/heatmap_data.csv')
-feature_importance = pd.read_csv('powerbi_data/feature_importance.csv')
-risk_distribution = pd.read_csv('powerbi_data/risk_distribution.csv')
+DATA_DIR = 'powerbi_data'
+OUTPUT_FILE = 'anomaly_detection_dashboard.html'
+PARTITION_DIR = 'dashboards'
+CACHE_DIR = '.dashboard_cache'
 
-# Convert date column
-anomaly_details['Date'] = pd.to_datetime(anomaly_details['Date'])
+# Source tables written by powerbi_data_preparation.py, with their date columns
+TABLES = {
+    'anomaly_details': ['Date'],
+    'executive_metrics': None,
+    'time_series': None,
+    'entity_summary': None,
+    'heatmap_data': None,
+    'feature_importance': None,
+    'risk_distribution': None,
+}
 
 # Define color scheme
 colors = {
@@ -34,15 +50,455 @@ colors = {
     'Critical': '#F44336'
 }
 
-# Create the HTML dashboard
-html_content = """
+# The plotly.js build the installed plotly package was made for. The CDN
+# link and the offline bundle both use it, so every mode renders the same.
+PLOTLY_JS_VERSION = get_plotlyjs_version()
+PLOTLY_CDN_URL = f'https://cdn.plot.ly/plotly-{PLOTLY_JS_VERSION}.min.js'
+
+
+def cached_plotly_bundle(cache_dir, bundle=None):
+    """
+    Path to the minified plotly.js bundle. The copy shipped with the plotly
+    package is written to cache_dir once per version and reused by every
+    later build; a bundle passed explicitly is used as is.
+    """
+    if bundle:
+        return bundle
+    path = os.path.join(cache_dir, f'plotly-{PLOTLY_JS_VERSION}.min.js')
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(get_plotlyjs())
+        os.replace(tmp_path, path)
+    return path
+
+
+def plotly_script_tag(mode, output_file, cache_dir, bundle=None):
+    """
+    The <script> tag that loads plotly.js. 'inline' embeds the bundle once
+    for all charts on the page; 'file' copies it next to the page so several
+    pages in one directory share a single download.
+    """
+    if mode == 'cdn':
+        return f'<script src="{PLOTLY_CDN_URL}" charset="utf-8"></script>'
+    source = cached_plotly_bundle(cache_dir, bundle)
+    if mode == 'inline':
+        with open(source, encoding='utf-8') as f:
+            return f'<script type="text/javascript">{f.read()}</script>'
+    target = os.path.join(os.path.dirname(os.path.abspath(output_file)), os.path.basename(source))
+    if not os.path.exists(target) or os.path.getsize(target) != os.path.getsize(source):
+        shutil.copyfile(source, target)
+    return f'<script src="{os.path.basename(source)}" charset="utf-8"></script>'
+
+
+# Plotly.js typed-array codes. int64 has no typed-array counterpart in the
+# browser, so integer arrays are narrowed to the smallest type that fits.
+TYPED_ARRAY_CODES = {
+    'int8': 'i1', 'uint8': 'u1', 'int16': 'i2', 'uint16': 'u2',
+    'int32': 'i4', 'uint32': 'u4', 'float32': 'f4', 'float64': 'f8',
+}
+
+
+def to_typed_array(values):
+    """Numeric numpy array as a Plotly.js {dtype, bdata, shape} payload."""
+    if values.dtype.kind in 'iu':
+        for dtype in ('int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32'):
+            info = np.iinfo(dtype)
+            if values.size == 0 or (values.min() >= info.min and values.max() <= info.max):
+                values = values.astype(dtype)
+                break
+    if values.dtype.name not in TYPED_ARRAY_CODES:
+        values = values.astype('float64')
+    payload = {
+        'dtype': TYPED_ARRAY_CODES[values.dtype.name],
+        'bdata': base64.b64encode(np.ascontiguousarray(values).tobytes()).decode('ascii'),
+    }
+    if values.ndim > 1:
+        payload['shape'] = ', '.join(str(n) for n in values.shape)
+    return payload
+
+
+def from_typed_array(payload):
+    """Decode a {dtype, bdata} payload back to a numpy array."""
+    values = np.frombuffer(base64.b64decode(payload['bdata']), dtype=np.dtype(payload['dtype']))
+    if 'shape' in payload:
+        values = values.reshape([int(n) for n in str(payload['shape']).split(',')])
+    return values
+
+
+def encode_arrays(value, binary):
+    """
+    Walk a figure dict and put every numeric array into one form: base64
+    typed arrays when binary is set, plain JSON lists otherwise. Depending on
+    the installed plotly, arrays arrive either as numpy arrays or already as
+    typed-array payloads, so both are normalised here.
+    """
+    if isinstance(value, dict):
+        if set(value) >= {'dtype', 'bdata'}:
+            value = from_typed_array(value)
+        else:
+            return {key: encode_arrays(item, binary) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_arrays(item, binary) for item in value]
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind in 'iuf' and binary:
+            return to_typed_array(value)
+        if value.dtype.kind in 'iuf':
+            return value.tolist()
+    return value
+
+
+def figure_json(fig, binary=False):
+    """Figure as JSON for Plotly.newPlot, with numeric arrays as typed arrays when binary is set."""
+    return json.dumps(encode_arrays(fig.to_plotly_json(), binary), cls=PlotlyJSONEncoder)
+
+
+def sample_scatter_points(details, max_points, seed=42):
+    """
+    Stratified sample of at most max_points rows. Critical rows are kept
+    first (a random max_points of them if there are more). The remaining
+    budget is split across the other risk levels in proportion to their
+    size, so the shape of the distribution survives.
+    """
+    critical = sample_critical(details, max_points, seed)
+    others = details[details['Risk_Level'] != 'Critical']
+    budget = max(max_points - len(critical), 0)
+    if len(others) > budget:
+        others = others.groupby('Risk_Level', observed=True).sample(
+            frac=budget / len(others), random_state=seed)
+    return pd.concat([critical, others]).sort_index()
+
+
+def sample_critical(details, max_points, seed=42):
+    """The Critical rows, or a random max_points of them if there are more."""
+    critical = details[details['Risk_Level'] == 'Critical']
+    if len(critical) > max_points:
+        critical = critical.sample(n=max_points, random_state=seed).sort_index()
+    return critical
+
+
+def density_figure(details, bins, max_points, webgl=False):
+    """
+    Amount vs risk as a binned count grid, with Critical points overlaid
+    individually (at most max_points of them; all of them are in the grid).
+    """
+    valid = details[['Transaction_Amount', 'Risk_Score']].dropna()
+    counts, x_edges, y_edges = np.histogram2d(valid['Transaction_Amount'], valid['Risk_Score'], bins=bins)
+    fig = go.Figure(go.Heatmap(
+        z=np.where(counts.T > 0, counts.T, np.nan),
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        colorscale='Blues',
+        colorbar=dict(title='Transactions'),
+        hovertemplate='Amount: %{x:,.0f}<br>Risk: %{y:.2f}<br>Count: %{z}<extra></extra>'
+    ))
+    critical = sample_critical(details, max_points)
+    point_trace = go.Scattergl if webgl else go.Scatter
+    fig.add_trace(point_trace(
+        x=critical['Transaction_Amount'],
+        y=critical['Risk_Score'],
+        mode='markers',
+        name='Critical',
+        marker=dict(color=colors['Critical'], size=6),
+        customdata=critical[['Entity', 'Agency']],
+        hovertemplate='%{customdata[0]} (%{customdata[1]})<br>Amount: %{x:,.2f}<br>Risk: %{y:.2f}<extra></extra>'
+    ))
+    fig.update_layout(xaxis_title='Transaction_Amount', yaxis_title='Risk_Score')
+    return fig
+
+
+# Figure stages. Each takes the loaded tables and the build options and
+# returns one figure; FIGURE_STAGES below lists what each one depends on.
+
+def trend_figure(tables, options):
+    time_series = tables['time_series']
+    fig_trend = go.Figure()
+    fig_trend.add_trace(go.Scatter(
+        x=time_series['Month'].values,
+        y=time_series['Anomaly_Count'].values,
+        mode='lines+markers',
+        name='Anomalies',
+        line=dict(color='#1976D2', width=3),
+        marker=dict(size=8),
+        fill='tozeroy',
+        fillcolor='rgba(25, 118, 210, 0.1)'
+    ))
+    fig_trend.update_layout(
+        showlegend=False,
+        height=300,
+        margin=dict(l=0, r=0, t=0, b=0),
+        xaxis_title="Month",
+        yaxis_title="Count",
+        hovermode='x unified'
+    )
+    return fig_trend
+
+
+def donut_figure(tables, options):
+    risk_distribution = tables['risk_distribution']
+    fig_donut = go.Figure(data=[go.Pie(
+        labels=risk_distribution['Risk_Level'].values,
+        values=risk_distribution['Count'].values,
+        hole=.5,
+        marker_colors=['#4CAF50', '#FFC107', '#FF9800', '#F44336']
+    )])
+    fig_donut.update_layout(
+        showlegend=True,
+        height=300,
+        margin=dict(l=0, r=0, t=0, b=0)
+    )
+    return fig_donut
+
+
+def entities_figure(tables, options):
+    top_10 = tables['entity_summary'].head(10)
+    fig_entities = go.Figure(data=[go.Bar(
+        x=top_10['Anomaly_Count'].values,
+        y=top_10['Entity'].values,
+        orientation='h',
+        marker_color='#1976D2',
+        text=top_10['Anomaly_Count'].values,
+        textposition='auto',
+    )])
+    fig_entities.update_layout(
+        height=400,
+        margin=dict(l=0, r=0, t=0, b=0),
+        xaxis_title="Anomaly Count",
+        yaxis_title=""
+    )
+    return fig_entities
+
+
+def resolve_scatter_mode(mode, n_rows, max_points):
+    """'auto' draws every point up to max_points and samples above that."""
+    if mode == 'auto':
+        return 'full' if n_rows <= max_points else 'sample'
+    return mode
+
+
+def scatter_figure(tables, options):
+    # Sampled or binned on large data so the page size stays bounded
+    anomaly_details = tables['anomaly_details']
+    scatter_mode = resolve_scatter_mode(options['scatter_mode'], len(anomaly_details), options['max_points'])
+    if scatter_mode == 'density':
+        fig_scatter = density_figure(anomaly_details, options['density_bins'], options['max_points'],
+                                     options['webgl'])
+    else:
+        scatter_points = anomaly_details
+        if scatter_mode == 'sample':
+            scatter_points = sample_scatter_points(anomaly_details, options['max_points'])
+        fig_scatter = px.scatter(
+            scatter_points,
+            x='Transaction_Amount',
+            y='Risk_Score',
+            color='Risk_Level',
+            size='Risk_Score',
+            color_discrete_map=colors,
+            hover_data=['Entity', 'Agency'],
+            render_mode='webgl' if options['webgl'] else 'svg'
+        )
+    fig_scatter.update_layout(
+        height=400,
+        margin=dict(l=0, r=0, t=0, b=0)
+    )
+    return fig_scatter
+
+
+def heatmap_figure(tables, options):
+    pivot_data = tables['heatmap_data'].pivot_table(
+        values='Count',
+        index='Day_Name',
+        columns='hour',
+        fill_value=0
+    )
+    fig_heatmap = go.Figure(data=go.Heatmap(
+        z=pivot_data.values,
+        x=pivot_data.columns,
+        y=pivot_data.index,
+        colorscale='Blues'
+    ))
+    fig_heatmap.update_layout(
+        height=400,
+        margin=dict(l=0, r=0, t=0, b=0),
+        xaxis_title="Hour of Day",
+        yaxis_title="Day of Week"
+    )
+    return fig_heatmap
+
+
+def features_figure(tables, options):
+    feature_importance = tables['feature_importance']
+    fig_features = go.Figure(data=[go.Bar(
+        x=feature_importance['Importance_Percentage'].values,
+        y=feature_importance['Feature'].values,
+        orientation='h',
+        marker_color=['#4CAF50' if x == 'Positive' else '#F44336' 
+                       for x in feature_importance['Impact_Direction'].values]
+    )])
+    fig_features.update_layout(
+        height=400,
+        margin=dict(l=0, r=0, t=0, b=0),
+        xaxis_title="Importance (%)",
+        yaxis_title=""
+    )
+    return fig_features
+
+
+def histogram_figure(tables, options):
+    # Binned here rather than shipping every score to the browser
+    risk_counts, risk_edges = np.histogram(tables['anomaly_details']['Risk_Score'].dropna(), bins=30)
+    fig_histogram = go.Figure(data=[go.Bar(
+        x=(risk_edges[:-1] + risk_edges[1:]) / 2,
+        y=risk_counts,
+        width=np.diff(risk_edges),
+        marker_color='#1976D2'
+    )])
+    fig_histogram.update_layout(
+        height=300,
+        margin=dict(l=0, r=0, t=0, b=0),
+        xaxis_title="Risk Score",
+        yaxis_title="Frequency"
+    )
+    return fig_histogram
+
+
+def agency_figure(tables, options):
+    agency_counts = tables['anomaly_details'].groupby('Agency', observed=True).size().reset_index(name='Count')
+    fig_agency = go.Figure(data=[go.Bar(
+        x=agency_counts['Agency'].values,
+        y=agency_counts['Count'].values,
+        marker_color=['#1976D2', '#4CAF50', '#FFC107']
+    )])
+    fig_agency.update_layout(
+        height=300,
+        margin=dict(l=0, r=0, t=0, b=0),
+        xaxis_title="Agency",
+        yaxis_title="Anomaly Count"
+    )
+    return fig_agency
+
+
+def table_figure(tables, options):
+    top_transactions = tables['anomaly_details'].nlargest(options['table_rows'], 'Risk_Score')[
+        ['Entity', 'Date', 'Transaction_Amount', 'Risk_Score', 'Risk_Level']
+    ]
+    fig_table = go.Figure(data=[go.Table(
+        header=dict(
+            values=['Entity', 'Date', 'Amount ($)', 'Risk Score', 'Level'],
+            fill_color='#1976D2',
+            font=dict(color='white', size=12),
+            align='left'
+        ),
+        cells=dict(
+            values=[
+                top_transactions['Entity'].values,
+                top_transactions['Date'].dt.strftime('%Y-%m-%d').values,
+                ['${:,.2f}'.format(x) for x in top_transactions['Transaction_Amount'].values],
+                ['{:.2f}'.format(x) for x in top_transactions['Risk_Score'].values],
+                top_transactions['Risk_Level'].values
+            ],
+            fill_color=['#f0f0f0', 'white'],
+            align='left'
+        )
+    )])
+    fig_table.update_layout(
+        height=400,
+        margin=dict(l=0, r=0, t=0, b=0)
+    )
+    return fig_table
+
+
+# (chart div id, builder, input tables, options the figure depends on)
+FIGURE_STAGES = [
+    ('trend-chart', trend_figure, ['time_series'], []),
+    ('risk-donut', donut_figure, ['risk_distribution'], []),
+    ('top-entities', entities_figure, ['entity_summary'], []),
+    ('scatter-plot', scatter_figure, ['anomaly_details'], ['scatter_mode', 'max_points', 'density_bins', 'webgl']),
+    ('heatmap', heatmap_figure, ['heatmap_data'], []),
+    ('feature-importance', features_figure, ['feature_importance'], []),
+    ('risk-histogram', histogram_figure, ['anomaly_details'], []),
+    ('agency-breakdown', agency_figure, ['anomaly_details'], []),
+    ('transactions-table', table_figure, ['anomaly_details'], ['table_rows']),
+]
+
+
+def load_tables(data_dir=DATA_DIR):
+    """
+    Load the dashboard tables (Parquet when powerbi_data_preparation.py wrote it, else CSV),
+    with string columns as categoricals and narrowed integers (schema.py).
+    """
+    return {name: compact_frame(read_table(data_dir, name, parse_dates=parse_dates, dtype=CSV_DTYPES))
+            for name, parse_dates in TABLES.items()}
+
+
+def table_hash(df):
+    """Content hash of a table: column names, dtypes and every value."""
+    digest = hashlib.sha256()
+    digest.update(repr([(column, str(dtype)) for column, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def code_hash():
+    """Hash of this module and the plotly version, so figure changes invalidate the cache."""
+    with open(__file__, 'rb') as f:
+        source = f.read()
+    return hashlib.sha256(source + plotly.__version__.encode()).hexdigest()
+
+
+def stage_key(div_id, input_hashes, options, code_version):
+    """Cache key of one figure: its inputs' content hashes plus the options it uses."""
+    payload = json.dumps([div_id, code_version, input_hashes, options], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def build_figures(tables, options, cache_dir=CACHE_DIR):
+    """
+    Run every figure stage and return ({div id: figure JSON}, rebuilt ids).
+    A stage whose input tables and options hash to a key already in
+    cache_dir/figures is read from there instead of being rebuilt. With
+    cache_dir=None every stage is rebuilt.
+    """
+    figure_dir = os.path.join(cache_dir, 'figures') if cache_dir else None
+    code_version = code_hash()
+    hashes = {}
+    figures, rebuilt = {}, []
+    for div_id, builder, inputs, option_names in FIGURE_STAGES:
+        for name in inputs:
+            if name not in hashes:
+                hashes[name] = table_hash(tables[name])
+        stage_options = {name: options[name] for name in option_names}
+        stage_options['binary_arrays'] = options['binary_arrays']
+        key = stage_key(div_id, [hashes[name] for name in inputs], stage_options, code_version)
+        path = os.path.join(figure_dir, f'{div_id}-{key[:20]}.json') if figure_dir else None
+
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                figures[div_id] = f.read()
+            continue
+
+        figures[div_id] = figure_json(builder(tables, options), options['binary_arrays'])
+        rebuilt.append(div_id)
+        if path:
+            os.makedirs(figure_dir, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(figures[div_id])
+            os.replace(tmp_path, path)
+    return figures, rebuilt
+
+
+def render_html(exec_metrics, figures, plotly_tag):
+    """Assemble the dashboard page from the KPI table and the figure JSON."""
+    html_content = """
 <!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Financial Anomaly Detection Dashboard</title>
-    <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
+    """ + plotly_tag + """
     <style>
         * {
             margin: 0;
@@ -412,207 +868,246 @@ html_content = """
     <script>
 """
 
-print("Creating visualizations...")
-
-# 1. Trend Chart
-fig_trend = go.Figure()
-fig_trend.add_trace(go.Scatter(
-    x=time_series['Month'].values,
-    y=time_series['Anomaly_Count'].values,
-    mode='lines+markers',
-    name='Anomalies',
-    line=dict(color='#1976D2', width=3),
-    marker=dict(size=8),
-    fill='tozeroy',
-    fillcolor='rgba(25, 118, 210, 0.1)'
-))
-fig_trend.update_layout(
-    showlegend=False,
-    height=300,
-    margin=dict(l=0, r=0, t=0, b=0),
-    xaxis_title="Month",
-    yaxis_title="Count",
-    hovermode='x unified'
-)
-
-# 2. Risk Donut Chart
-fig_donut = go.Figure(data=[go.Pie(
-    labels=risk_distribution['Risk_Level'].values,
-    values=risk_distribution['Count'].values,
-    hole=.5,
-    marker_colors=['#4CAF50', '#FFC107', '#FF9800', '#F44336']
-)])
-fig_donut.update_layout(
-    showlegend=True,
-    height=300,
-    margin=dict(l=0, r=0, t=0, b=0)
-)
-
-# 3. Top Entities Bar Chart
-top_10 = entity_summary.head(10)
-fig_entities = go.Figure(data=[go.Bar(
-    x=top_10['Anomaly_Count'].values,
-    y=top_10['Entity'].values,
-    orientation='h',
-    marker_color='#1976D2',
-    text=top_10['Anomaly_Count'].values,
-    textposition='auto',
-)])
-fig_entities.update_layout(
-    height=400,
-    margin=dict(l=0, r=0, t=0, b=0),
-    xaxis_title="Anomaly Count",
-    yaxis_title=""
-)
-
-# 4. Scatter Plot
-fig_scatter = px.scatter(
-    anomaly_details,
-    x='Transaction_Amount',
-    y='Risk_Score',
-    color='Risk_Level',
-    size='Risk_Score',
-    color_discrete_map=colors,
-    hover_data=['Entity', 'Agency']
-)
-fig_scatter.update_layout(
-    height=400,
-    margin=dict(l=0, r=0, t=0, b=0)
-)
-
-# 5. Heatmap
-pivot_data = heatmap_data.pivot_table(
-    values='Count',
-    index='Day_Name',
-    columns='hour',
-    fill_value=0
-)
-fig_heatmap = go.Figure(data=go.Heatmap(
-    z=pivot_data.values,
-    x=pivot_data.columns,
-    y=pivot_data.index,
-    colorscale='Blues'
-))
-fig_heatmap.update_layout(
-    height=400,
-    margin=dict(l=0, r=0, t=0, b=0),
-    xaxis_title="Hour of Day",
-    yaxis_title="Day of Week"
-)
-
-# 6. Feature Importance
-fig_features = go.Figure(data=[go.Bar(
-    x=feature_importance['Importance_Percentage'].values,
-    y=feature_importance['Feature'].values,
-    orientation='h',
-    marker_color=['#4CAF50' if x == 'Positive' else '#F44336' 
-                   for x in feature_importance['Impact_Direction'].values]
-)])
-fig_features.update_layout(
-    height=400,
-    margin=dict(l=0, r=0, t=0, b=0),
-    xaxis_title="Importance (%)",
-    yaxis_title=""
-)
-
-# 7. Risk Histogram
-fig_histogram = go.Figure(data=[go.Histogram(
-    x=anomaly_details['Risk_Score'].values,
-    nbinsx=30,
-    marker_color='#1976D2'
-)])
-fig_histogram.update_layout(
-    height=300,
-    margin=dict(l=0, r=0, t=0, b=0),
-    xaxis_title="Risk Score",
-    yaxis_title="Frequency"
-)
-
-# 8. Agency Breakdown
-agency_counts = anomaly_details.groupby('Agency').size().reset_index(name='Count')
-fig_agency = go.Figure(data=[go.Bar(
-    x=agency_counts['Agency'].values,
-    y=agency_counts['Count'].values,
-    marker_color=['#1976D2', '#4CAF50', '#FFC107']
-)])
-fig_agency.update_layout(
-    height=300,
-    margin=dict(l=0, r=0, t=0, b=0),
-    xaxis_title="Agency",
-    yaxis_title="Anomaly Count"
-)
-
-# 9. Transactions Table
-top_transactions = anomaly_details.nlargest(10, 'Risk_Score')[
-    ['Entity', 'Date', 'Transaction_Amount', 'Risk_Score', 'Risk_Level']
-]
-fig_table = go.Figure(data=[go.Table(
-    header=dict(
-        values=['Entity', 'Date', 'Amount ($)', 'Risk Score', 'Level'],
-        fill_color='#1976D2',
-        font=dict(color='white', size=12),
-        align='left'
-    ),
-    cells=dict(
-        values=[
-            top_transactions['Entity'].values,
-            top_transactions['Date'].dt.strftime('%Y-%m-%d').values,
-            ['${:,.2f}'.format(x) for x in top_transactions['Transaction_Amount'].values],
-            ['{:.2f}'.format(x) for x in top_transactions['Risk_Score'].values],
-            top_transactions['Risk_Level'].values
-        ],
-        fill_color=['#f0f0f0', 'white'],
-        align='left'
+    # Add all charts to HTML
+    html_content += ''.join(
+        f"        Plotly.newPlot('{div_id}', {figure});\n" for div_id, figure in figures.items()
     )
-)])
-fig_table.update_layout(
-    height=400,
-    margin=dict(l=0, r=0, t=0, b=0)
-)
-
-# Add all charts to HTML
-html_content += f"""
-        Plotly.newPlot('trend-chart', {fig_trend.to_json()});
-        Plotly.newPlot('risk-donut', {fig_donut.to_json()});
-        Plotly.newPlot('top-entities', {fig_entities.to_json()});
-        Plotly.newPlot('scatter-plot', {fig_scatter.to_json()});
-        Plotly.newPlot('heatmap', {fig_heatmap.to_json()});
-        Plotly.newPlot('feature-importance', {fig_features.to_json()});
-        Plotly.newPlot('risk-histogram', {fig_histogram.to_json()});
-        Plotly.newPlot('agency-breakdown', {fig_agency.to_json()});
-        Plotly.newPlot('transactions-table', {fig_table.to_json()});
-        
-        function switchTab(tabName) {{
+    html_content += """        
+        function switchTab(tabName) {
             // Hide all tabs
-            document.querySelectorAll('.tab-content').forEach(tab => {{
+            document.querySelectorAll('.tab-content').forEach(tab => {
                 tab.classList.remove('active');
-            }});
-            document.querySelectorAll('.nav-tab').forEach(tab => {{
+            });
+            document.querySelectorAll('.nav-tab').forEach(tab => {
                 tab.classList.remove('active');
-            }});
+            });
             
             // Show selected tab
             document.getElementById(tabName).classList.add('active');
             event.target.classList.add('active');
-        }}
+        }
     </script>
 </body>
 </html>
 """
+    return html_content
+
+
+def build_dashboard(data_dir=DATA_DIR, output_file=OUTPUT_FILE, cache_dir=CACHE_DIR, use_cache=True,
+                    tables=None, scatter_mode='auto', max_points=5000, density_bins=80, table_rows=10,
+                    webgl=False, binary_arrays=False, plotly_js='cdn', plotly_bundle=None):
+    """
+    Build the dashboard HTML and return a summary of the build.
+
+    Input: the Power BI tables from data_dir (or already loaded tables) and the rendering options.
+    Output: dict with output_file, rows, scatter_mode and the rebuilt / cached figure ids.
+    Figures whose inputs did not change since the last build come from cache_dir
+    unless use_cache is False.
+    """
+    if tables is None:
+        tables = load_tables(data_dir)
+    options = {
+        'scatter_mode': scatter_mode,
+        'max_points': max_points,
+        'density_bins': density_bins,
+        'table_rows': table_rows,
+        'webgl': webgl,
+        'binary_arrays': binary_arrays,
+    }
+    figures, rebuilt = build_figures(tables, options, cache_dir if use_cache else None)
+    plotly_tag = plotly_script_tag(plotly_js, output_file, cache_dir, plotly_bundle)
+    html_content = render_html(tables['executive_metrics'], figures, plotly_tag)
+
+    # Save the HTML file
+    with open(output_file, 'w') as f:
+        f.write(html_content)
+
+    return {
+        'output_file': output_file,
+        'rows': len(tables['anomaly_details']),
+        'scatter_mode': resolve_scatter_mode(scatter_mode, len(tables['anomaly_details']), max_points),
+        'rebuilt': rebuilt,
+        'cached': [div_id for div_id in figures if div_id not in rebuilt],
+    }
+
+
+def partition_tables(tables, column):
+    """
+    Split the dashboard tables by a column of anomaly_details. Yields
+    (value, tables) per value, with the summary tables recomputed from that
+    slice of anomaly_details; feature importance is model-wide and shared.
+    """
+    for value, details in tables['anomaly_details'].groupby(column, observed=True, sort=True):
+        summaries, _ = summary_tables(partial_aggregates(frame_from_details(details)), verbose=False)
+        yield value, {**tables, **summaries, 'anomaly_details': details}
+
+
+def partition_file_name(column, value):
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', str(value)).strip('-').lower() or 'blank'
+    return f"{column.lower()}-{slug}.html"
+
+
+def _build_partition(job):
+    value, tables, output_file, options = job
+    summary = build_dashboard(output_file=output_file, tables=tables, **options)
+    metrics = tables['executive_metrics'].iloc[0]
+    summary.update(
+        value=value,
+        anomalies=int(metrics['Anomalies_Detected']),
+        high_risk=int(metrics['High_Risk_Count']),
+        amount_flagged=float(metrics['Total_Amount_Flagged']),
+    )
+    return summary
+
+
+def render_index(column, summaries):
+    """Index page linking every partition dashboard."""
+    rows = ''.join(
+        f"""            <tr>
+                <td><a href="{html.escape(os.path.basename(summary['output_file']))}">{html.escape(str(summary['value']))}</a></td>
+                <td>{summary['anomalies']:,}</td>
+                <td>{summary['high_risk']:,}</td>
+                <td>${summary['amount_flagged']:,.2f}</td>
+            </tr>
+"""
+        for summary in summaries
+    )
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Anomaly Dashboards by {html.escape(column)}</title>
+    <style>
+        body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; margin: 40px; color: #333; }}
+        h1 {{ color: #1976D2; }}
+        table {{ border-collapse: collapse; min-width: 600px; }}
+        th, td {{ padding: 10px 16px; border-bottom: 1px solid #e0e0e0; text-align: left; }}
+        th {{ background: #1976D2; color: white; }}
+        a {{ color: #1976D2; text-decoration: none; font-weight: 600; }}
+    </style>
+</head>
+<body>
+    <h1>Anomaly Dashboards by {html.escape(column)}</h1>
+    <table>
+        <thead>
+            <tr><th>{html.escape(column)}</th><th>Anomalies</th><th>High Risk</th><th>Amount Flagged</th></tr>
+        </thead>
+        <tbody>
+{rows}        </tbody>
+    </table>
+    <p>Generated on {datetime.now().strftime("%B %d, %Y at %I:%M %p")}</p>
+</body>
+</html>
+"""
+
+
+def build_partitioned(column, data_dir=DATA_DIR, output_dir=PARTITION_DIR, workers=None, tables=None,
+                      **options):
+    """
+    Fan-out build: one dashboard per value of column plus an index.html.
+
+    Input: the Power BI tables (loaded once), the partition column and build_dashboard() options.
+    Output: list of per-partition build summaries, in partition order.
+    The source tables are split in this process and the pages are rendered in
+    worker processes, which share the figure cache and plotly.js bundle.
+    """
+    if tables is None:
+        tables = load_tables(data_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    index_file = os.path.join(output_dir, 'index.html')
+
+    # Prepare the shared plotly.js bundle once, before the workers need it
+    plotly_script_tag(options.get('plotly_js', 'cdn'), index_file, options.get('cache_dir', CACHE_DIR),
+                      options.get('plotly_bundle'))
+
+    jobs = [
+        (value, part, os.path.join(output_dir, partition_file_name(column, value)), options)
+        for value, part in partition_tables(tables, column)
+    ]
+    with ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+        summaries = list(pool.map(_build_partition, jobs))
+
+    with open(index_file, 'w') as f:
+        f.write(render_index(column, summaries))
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the standalone HTML anomaly dashboard")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Directory with the Power BI tables")
+    parser.add_argument('--scatter-mode', choices=['auto', 'full', 'sample', 'density'], default='auto',
+                        help="Amount vs risk chart: every point, a stratified sample that keeps all Critical "
+                             "points, or a 2D density grid. 'auto' samples above --max-points")
+    parser.add_argument('--max-points', type=int, default=5000, help="Point budget for the sampled scatter")
+    parser.add_argument('--density-bins', type=int, default=80, help="Grid size per axis in density mode")
+    parser.add_argument('--table-rows', type=int, default=10, help="Transactions shown in the high-risk table")
+    parser.add_argument('--webgl', action='store_true',
+                        help="Draw the point-heavy charts with WebGL (Scattergl) instead of SVG")
+    parser.add_argument('--binary-arrays', action='store_true',
+                        help="Embed numeric arrays as base64 typed arrays instead of decimal text")
+    parser.add_argument('--plotly-js', choices=['cdn', 'inline', 'file'], default='cdn',
+                        help="Load plotly.js from the CDN, inline it into the page (works offline), or copy it "
+                             "next to the page as a shared plotly-<version>.min.js")
+    parser.add_argument('--plotly-bundle', default=None,
+                        help="Use this plotly.js bundle (e.g. a custom partial build) instead of the one "
+                             "shipped with the plotly package")
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                        help="Where the plotly.js bundle and the figure cache are kept")
+    parser.add_argument('--no-cache', action='store_true', help="Rebuild every figure")
+    parser.add_argument('--output', default=OUTPUT_FILE, help="HTML file to write")
+    parser.add_argument('--partition-by', default=None,
+                        help="Build one dashboard per value of this anomaly_details column (e.g. Agency) "
+                             "plus an index page, instead of a single dashboard")
+    parser.add_argument('--output-dir', default=PARTITION_DIR, help="Where --partition-by writes its pages")
+    parser.add_argument('--workers', type=int, help="Worker processes for --partition-by (default: all cores)")
+    args = parser.parse_args()
+
+    print("📊 Creating Financial Anomaly Detection Dashboard...")
+    print("=" * 60)
+    print("Loading data files...")
+    tables = load_tables(args.data_dir)
+
+    options = dict(
+        cache_dir=args.cache_dir,
+        use_cache=not args.no_cache,
+        scatter_mode=args.scatter_mode,
+        max_points=args.max_points,
+        density_bins=args.density_bins,
+        table_rows=args.table_rows,
+        webgl=args.webgl,
+        binary_arrays=args.binary_arrays,
+        plotly_js=args.plotly_js,
+        plotly_bundle=args.plotly_bundle,
+    )
+
+    if args.partition_by:
+        print(f"Creating one dashboard per {args.partition_by} with {args.workers or os.cpu_count()} workers...")
+        summaries = build_partitioned(args.partition_by, output_dir=args.output_dir, workers=args.workers,
+                                      tables=tables, **options)
+        print(f"\n✅ {len(summaries)} dashboards created successfully!")
+        print(f"📁 Index page: {os.path.join(args.output_dir, 'index.html')}")
+        print(f"📊 Figures rebuilt: {sum(len(summary['rebuilt']) for summary in summaries)}, "
+              f"from cache: {sum(len(summary['cached']) for summary in summaries)}")
+        return
+
+    print("Creating visualizations...")
+    summary = build_dashboard(output_file=args.output, tables=tables, **options)
+    output_file = summary['output_file']
+
+    print(f"\n✅ Dashboard created successfully!")
+    print(f"📁 File saved as: {output_file}")
+    print(f"📊 Total visualizations: {len(FIGURE_STAGES)} "
+          f"({len(summary['rebuilt'])} rebuilt, {len(summary['cached'])} from cache)")
+    print(f"📦 plotly.js {PLOTLY_JS_VERSION}: {args.plotly_js}")
+    print(f"📈 Data points analyzed: {summary['rows']:,} (scatter: {summary['scatter_mode']})")
+    print(f"\n🚀 To view the dashboard:")
+    print(f"   1. Open Finder")
+    print(f"   2. Navigate to: {os.getcwd()}")
+    print(f"   3. Double-click: {output_file}")
+    print(f"   Or run: open {output_file}")
+    print("\n" + "=" * 60)
+    print("Dashboard is fully interactive - hover, zoom, and click on elements!")
+
 
-# Save the HTML file
-output_file = 'anomaly_detection_dashboard.html'
-with open(output_file, 'w') as f:
-    f.write(html_content)
-
-print(f"\n✅ Dashboard created successfully!")
-print(f"📁 File saved as: {output_file}")
-print(f"📊 Total visualizations: 9")
-print(f"📈 Data points analyzed: {len(anomaly_details):,}")
-print(f"\n🚀 To view the dashboard:")
-print(f"   1. Open Finder")
-print(f"   2. Navigate to: {os.getcwd()}")
-print(f"   3. Double-click: {output_file}")
-print(f"   Or run: open {output_file}")
-print("\n" + "=" * 60)
-print("Dashboard is fully interactive - hover, zoom, and click on elements!")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+import os
+import shutil
+
+import pandas as pd
+
+# Default rows per chunk for streaming reads
+CHUNKSIZE = 500_000
+
+
+# Output formats for the reporting tables
+TABLE_FORMATS = ('csv', 'parquet')
+
+
+def is_parquet(path):
+    return str(path).endswith(('.parquet', '.pq'))
+
+
+def table_path(directory, name):
+    """
+    Path of table `name` in `directory`: <name>.parquet if present, else a
+    <name>/ directory of partition files, else <name>.csv.
+    """
+    parquet = os.path.join(directory, f'{name}.parquet')
+    if os.path.exists(parquet):
+        return parquet
+    partitions = os.path.join(directory, name)
+    if os.path.isdir(partitions):
+        return partitions
+    return os.path.join(directory, f'{name}.csv')
+
+
+def partition_files(path):
+    """Part files of a partitioned table, Parquet parts preferred, in name order."""
+    names = sorted(os.listdir(path))
+    parts = [n for n in names if is_parquet(n)] or [n for n in names if n.endswith('.csv')]
+    return [os.path.join(path, n) for n in parts]
+
+
+def partition_formats(directory, name):
+    """Formats ('csv', 'parquet') of the existing part files of table `name`."""
+    path = os.path.join(directory, name)
+    if not os.path.isdir(path):
+        return set()
+    return {'parquet' if is_parquet(n) else 'csv' for n in os.listdir(path)
+            if is_parquet(n) or n.endswith('.csv')}
+
+
+def read_table(directory, name, parse_dates=None, dtype=None):
+    """
+    Load a table written by write_table() or write_partition(). Parquet keeps
+    categoricals and dates as written, so only CSV needs parsing.
+    """
+    return read_path(table_path(directory, name), parse_dates, dtype)
+
+
+def read_path(path, parse_dates=None, dtype=None):
+    """
+    Load a CSV or Parquet file, or a directory of part files, as one
+    DataFrame. dtype is passed to read_csv (e.g. 'category' columns, so
+    strings are never materialized per row).
+    """
+    if os.path.isdir(path):
+        parts = partition_files(path)
+        if parts and is_parquet(parts[0]):
+            return pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True)
+        return pd.concat([pd.read_csv(p, parse_dates=parse_dates, dtype=dtype) for p in parts],
+                         ignore_index=True)
+    if is_parquet(path):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, parse_dates=parse_dates, dtype=dtype)
+
+
+def count_rows(path):
+    """Data rows in a CSV or Parquet file; Parquet only reads the footer."""
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    with open(path, 'rb') as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def column_names(path):
+    """Column names of a CSV or Parquet file, or of the first part of a directory, without reading rows."""
+    if os.path.isdir(path):
+        parts = partition_files(path)
+        return column_names(parts[0]) if parts else []
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        return list(pq.ParquetFile(path).schema_arrow.names)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def dictionary_encode(df, max_unique_fraction=0.5):
+    """Store repetitive string columns as categoricals (Parquet dictionary columns)."""
+    converted = {}
+    for column in df.select_dtypes(include=['object', 'string']).columns:
+        if df[column].nunique() <= max(1, len(df) * max_unique_fraction):
+            converted[column] = df[column].astype('category')
+    return df.assign(**converted) if converted else df
+
+
+def write_table(df, directory, name, formats=('csv',)):
+    """Write table `name` to `directory` in each of `formats` ('csv', 'parquet')."""
+    os.makedirs(directory, exist_ok=True)
+    # A full table replaces any partitions left by incremental runs
+    shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    for fmt in formats:
+        if fmt == 'parquet':
+            dictionary_encode(df).to_parquet(os.path.join(directory, f'{name}.parquet'), index=False)
+        elif fmt == 'csv':
+            df.to_csv(os.path.join(directory, f'{name}.csv'), index=False)
+            # Drop a stale Parquet copy so readers don't prefer outdated data
+            stale = os.path.join(directory, f'{name}.parquet')
+            if 'parquet' not in formats and os.path.exists(stale):
+                os.remove(stale)
+        else:
+            raise ValueError(f"Unknown table format {fmt!r}; expected one of {TABLE_FORMATS}")
+
+
+def write_partition(df, directory, name, partition, formats=('csv',)):
+    """
+    Write one partition of table `name` as <directory>/<name>/part-<partition>.
+    Rewriting the same partition id replaces it, so a retried batch is not
+    duplicated. Monolithic copies of the table are removed because readers
+    would otherwise prefer them.
+    """
+    path = os.path.join(directory, name)
+    os.makedirs(path, exist_ok=True)
+    for fmt in formats:
+        part = os.path.join(path, f'part-{partition}.{fmt}')
+        if fmt == 'parquet':
+            dictionary_encode(df).to_parquet(part, index=False)
+        else:
+            df.to_csv(part, index=False)
+    for ext in TABLE_FORMATS:
+        stale = os.path.join(directory, f'{name}.{ext}')
+        if os.path.exists(stale):
+            os.remove(stale)
+
+
+def iter_chunks(path, chunksize=CHUNKSIZE, columns=None, dtype=None, parse_dates=None):
+    """
+    Yield DataFrames of at most `chunksize` rows from a CSV or Parquet file,
+    so the whole file is never held in memory.
+    """
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            chunk = batch.to_pandas()
+            if dtype:
+                chunk = chunk.astype({k: v for k, v in dtype.items() if k in chunk.columns})
+            yield chunk
+    else:
+        if parse_dates:
+            # Only parse date columns the file actually has
+            header = pd.read_csv(path, nrows=0).columns
+            parse_dates = [c for c in parse_dates if c in header] or None
+        yield from pd.read_csv(path, chunksize=chunksize, usecols=columns, dtype=dtype,
+                               parse_dates=parse_dates)
+
+
+class ChunkWriter:
+    """
+    Append DataFrame chunks to a CSV or Parquet file (chosen by extension).
+    The CSV header is written once; Parquet chunks become row groups.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._header_written = False
+        self._parquet_writer = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not is_parquet(path) and os.path.exists(path):
+            os.remove(path)
+
+    def write(self, chunk):
+        if is_parquet(self.path):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                # Categorical index widths can differ between chunks
+                table = table.cast(self._parquet_writer.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            chunk.to_csv(self.path, mode='a', header=not self._header_written, index=False)
+            self._header_written = True
+        self.rows += len(chunk)
+
+    def append_file(self, part_path, rows):
+        """
+        Append a part file written by another ChunkWriter of the same format
+        and holding `rows` rows. CSV parts are copied byte for byte.
+        """
+        if is_parquet(self.path):
+            import pyarrow.parquet as pq
+            part = pq.ParquetFile(part_path)
+            for i in range(part.num_row_groups):
+                self.write(part.read_row_group(i).to_pandas())
+            return
+        if os.path.getsize(part_path) == 0:
+            return
+        with open(part_path, 'rb') as src, open(self.path, 'ab') as dst:
+            header = src.readline()
+            if not self._header_written:
+                dst.write(header)
+                self._header_written = True
+            shutil.copyfileobj(src, dst)
+        self.rows += rows
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        elif not self._header_written and not is_parquet(self.path):
+            # Still leave a file behind for empty input
+            open(self.path, 'w').close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PartitionedWriter:
+    """
+    Append chunks to a partitioned table: <directory>/part-<n>.<fmt>, the
+    layout read_table() loads. Rows go to an in-progress part under
+    _inprogress/ that commit() moves into place, so readers never see a
+    half-written file. Part numbers continue after the existing ones and
+    are zero-padded, so name order is append order. A part is committed
+    automatically once it holds rows_per_part rows.
+    """
+
+    def __init__(self, directory, fmt='parquet', rows_per_part=1_000_000):
+        if fmt not in TABLE_FORMATS:
+            raise ValueError(f"Unknown table format {fmt!r}; expected one of {TABLE_FORMATS}")
+        self.directory = directory
+        self.fmt = fmt
+        self.rows_per_part = rows_per_part
+        self.rows = 0
+        self.parts = 0
+        self._writer = None
+        self._staging = os.path.join(directory, '_inprogress')
+        # Leftovers of an interrupted run were never committed
+        shutil.rmtree(self._staging, ignore_errors=True)
+        os.makedirs(self._staging)
+        numbers = [int(n[5:].split('.')[0]) for n in os.listdir(directory)
+                   if n.startswith('part-') and n[5:].split('.')[0].isdigit()]
+        self._next_part = max(numbers, default=-1) + 1
+
+    @property
+    def pending_rows(self):
+        """Rows written to the current part but not yet committed."""
+        return self._writer.rows if self._writer else 0
+
+    def write(self, chunk):
+        if len(chunk) == 0:
+            return
+        if self._writer is None:
+            self._writer = ChunkWriter(os.path.join(self._staging, f'part-{self._next_part:06d}.{self.fmt}'))
+        self._writer.write(chunk)
+        self.rows += len(chunk)
+        if self._writer.rows >= self.rows_per_part:
+            self.commit()
+
+    def commit(self):
+        """Publish the current part, if it has any rows."""
+        if self._writer is None:
+            return
+        self._writer.close()
+        os.replace(self._writer.path, os.path.join(self.directory, os.path.basename(self._writer.path)))
+        self._writer = None
+        self._next_part += 1
+        self.parts += 1
+
+    def close(self):
+        self.commit()
+        shutil.rmtree(self._staging, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
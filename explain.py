@@ -0,0 +1,212 @@
+import argparse
+import os
+import threading
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from data_io import ChunkWriter, CHUNKSIZE
+from scoring import score_chunk, read_raw_chunks
+import model_store
+
+# Flagged rows passed to the explainer per call
+EXPLAIN_BATCH_SIZE = 1024
+EXPLANATIONS_DIR = 'explanations'
+
+# Dashboard names for the raw fields the encoded features come from
+FEATURE_LABELS = {
+    'amount': 'Transaction Amount',
+    'agency': 'Agency Type',
+    'recipient_type': 'Recipient Type',
+    'month': 'Seasonal Factor (Month)',
+    'day_of_week': 'Day of Week',
+}
+
+
+def get_explainer(model, model_dir=model_store.MODEL_DIR, version=None):
+    """
+    Return the SHAP TreeExplainer for a model version. It is built once from
+    the background set saved with the artifact and cached next to it as
+    explainer.joblib, so later runs and server workers don't pay to build it.
+    """
+    if not hasattr(model, 'estimators_'):
+        raise ValueError(f"{type(model).__name__} models have no SHAP explainer; "
+                         "train with --detector isolation_forest to use /explain")
+    import shap
+    
+    path = os.path.join(model_store.artifact_path(model_dir, version), model_store.EXPLAINER_FILE)
+    if os.path.exists(path):
+        return joblib.load(path)
+    
+    background = model_store.load_background(model_dir, version)
+    if background is None:
+        # Older artifacts have no background; path-dependent SHAP needs none
+        explainer = shap.TreeExplainer(model)
+    else:
+        explainer = shap.TreeExplainer(model, data=background)
+    # Write then rename, so a concurrent worker never loads a half-written file
+    tmp = f'{path}.{os.getpid()}.tmp'
+    joblib.dump(explainer, tmp)
+    os.replace(tmp, path)
+    return explainer
+
+
+class ExplanationCache:
+    """
+    Bounded, thread-safe LRU cache of explanations. Keys are
+    (model_version, encoded_row.tobytes()), so a repeated transaction hits
+    no matter how its JSON was formatted, and a model rollout never serves
+    stale attributions.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_version, row):
+        return model_version, row.tobytes()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def shap_values(explainer, X, batch_size=EXPLAIN_BATCH_SIZE):
+    """SHAP values for the rows of X, computed in batches of batch_size."""
+    if len(X) == 0:
+        return np.empty((0, X.shape[1]))
+    return np.vstack([explainer.shap_values(X[i:i + batch_size]) for i in range(0, len(X), batch_size)])
+
+
+def source_field(encoder, feature):
+    """Map an encoded column (e.g. agency_Health) back to its raw field (agency)."""
+    for column in encoder.categorical_columns:
+        if feature.startswith(column + '_'):
+            return column
+    return feature
+
+
+def global_importance(encoder, abs_sums, signed_sums, count):
+    """
+    Global importance table in the layout powerbi_data_preparation.py exports
+    as feature_importance.csv. One-hot columns are summed back into their
+    source field. Importance is mean |SHAP|; Impact_Direction is the sign of
+    the mean SHAP value. For an IsolationForest SHAP values are in
+    path-length space, where larger means more normal (like /explain's
+    base_path_length and path_length_contributions), so 'Negative' means
+    the field shortens paths, pushing flagged rows towards anomalous.
+    """
+    fields = {}
+    for feature, abs_sum, signed_sum in zip(encoder.feature_columns, abs_sums, signed_sums):
+        field = source_field(encoder, feature)
+        totals = fields.setdefault(field, [0.0, 0.0])
+        totals[0] += abs_sum
+        totals[1] += signed_sum
+    
+    importance = pd.DataFrame({
+        'Feature': [FEATURE_LABELS.get(f, f) for f in fields],
+        'Importance': [t[0] / max(count, 1) for t in fields.values()],
+        'Impact_Direction': ['Positive' if t[1] >= 0 else 'Negative' for t in fields.values()],
+    })
+    importance = importance.sort_values('Importance', ascending=False)
+    total = importance['Importance'].sum()
+    importance['Importance_Percentage'] = importance['Importance'] / total * 100 if total else 0.0
+    return importance
+
+
+def explain_file(path, output_dir=EXPLANATIONS_DIR, model_dir=model_store.MODEL_DIR, version=None,
+                 chunksize=CHUNKSIZE, batch_size=EXPLAIN_BATCH_SIZE):
+    """
+    Compute SHAP values for the anomalies in `path` only. Already-scored
+    files (with is_anomaly) are filtered directly; raw transactions are
+    scored first. Writes:
+      anomaly_explanations.csv  one row per flagged transaction, shap_<feature> columns
+      feature_importance.csv    global importance over all flagged rows
+    Returns the number of explained rows.
+    """
+    model, metadata = model_store.load_model(model_dir, version)
+    encoder = model_store.load_encoder(metadata)
+    explainer = get_explainer(model, model_dir, metadata['version'])
+    
+    os.makedirs(output_dir, exist_ok=True)
+    abs_sums = np.zeros(encoder.n_features)
+    signed_sums = np.zeros(encoder.n_features)
+    explained = 0
+    offset = 0
+    
+    with ChunkWriter(os.path.join(output_dir, 'anomaly_explanations.csv')) as writer:
+        for chunk in read_raw_chunks(path, chunksize):
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            offset += len(chunk)
+            if 'is_anomaly' not in chunk.columns:
+                chunk = score_chunk(model, encoder, chunk).set_index(chunk.index)
+            flagged = chunk[chunk['is_anomaly'] == 'Anomaly']
+            if flagged.empty:
+                continue
+            
+            X, _ = encoder.encode_frame(flagged)
+            values = shap_values(explainer, X, batch_size)
+            abs_sums += np.abs(values).sum(axis=0)
+            signed_sums += values.sum(axis=0)
+            explained += len(values)
+            
+            rows = flagged.reset_index(names='row_index')
+            contributions = pd.DataFrame(values, columns=[f'shap_{c}' for c in encoder.feature_columns])
+            writer.write(pd.concat([rows, contributions], axis=1))
+            print(f"  explained {explained:,} anomalies")
+    
+    importance = global_importance(encoder, abs_sums, signed_sums, explained)
+    importance.to_csv(os.path.join(output_dir, 'feature_importance.csv'), index=False)
+    return explained
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Explain flagged transactions with SHAP")
+    parser.add_argument('input', nargs='?', default='anomalies_detected.csv',
+                        help="Scored (anomalies_detected.csv) or raw transactions, CSV or Parquet")
+    parser.add_argument('--output-dir', default=EXPLANATIONS_DIR)
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE)
+    parser.add_argument('--batch-size', type=int, default=EXPLAIN_BATCH_SIZE, help="Rows per TreeSHAP call")
+    parser.add_argument('--model-dir', default=model_store.MODEL_DIR)
+    parser.add_argument('--version', help="Model version (default: LATEST)")
+    args = parser.parse_args(argv)
+    
+    print(f"Explaining anomalies in {args.input}...")
+    explained = explain_file(args.input, args.output_dir, args.model_dir, args.version,
+                             args.chunksize, args.batch_size)
+    print(f"\n✅ Explained {explained:,} anomalies")
+    print(f"📁 Per-row and global importances saved in '{args.output_dir}'")
+
+
+if __name__ == "__main__":
+    main()
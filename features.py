@@ -0,0 +1,182 @@
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+# Raw transaction fields used by the notebook's encoding step
+CATEGORICAL_COLUMNS = ['agency', 'recipient_type']
+NUMERIC_COLUMNS = ['amount']
+DATE_COLUMN = 'payment_date'
+DATE_FEATURES = ['month', 'day_of_week']
+
+
+class UnknownCategoryError(ValueError):
+    """Raised when handle_unknown='error' and a category was not seen in training."""
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    raise ValueError(f'Cannot parse {DATE_COLUMN} value {value!r}')
+
+
+class FeatureEncoder:
+    """
+    Reproduce the notebook's feature layout without pandas on the hot path:
+
+        amount, <agency dummies>, <recipient_type dummies>, month, day_of_week
+
+    fit() learns the sorted categories of each categorical column and, like
+    pd.get_dummies(drop_first=True), leaves out the first one. At inference
+    each raw JSON record is written straight into a preallocated NumPy row
+    using dict lookups from category to column index.
+
+    A category not seen in training is encoded like the dropped baseline
+    (all zeros). It is also reported back as (row, column, value), or raises
+    UnknownCategoryError when handle_unknown='error'.
+    """
+
+    def __init__(self, categorical_columns=CATEGORICAL_COLUMNS, numeric_columns=NUMERIC_COLUMNS,
+                 date_column=DATE_COLUMN, handle_unknown='report'):
+        if handle_unknown not in ('report', 'error'):
+            raise ValueError("handle_unknown must be 'report' or 'error'")
+        self.categorical_columns = list(categorical_columns)
+        self.numeric_columns = list(numeric_columns)
+        self.date_column = date_column
+        self.handle_unknown = handle_unknown
+        self.categories = {}
+
+    def fit(self, data):
+        return self.set_categories({
+            column: pd.unique(data[column].dropna()) for column in self.categorical_columns
+        })
+
+    def set_categories(self, categories):
+        """Fit from already-collected category values, e.g. gathered chunk by chunk."""
+        self.categories = {
+            column: sorted(str(v) for v in categories[column])
+            for column in self.categorical_columns
+        }
+        self._build_lookups()
+        return self
+
+    def _build_lookups(self):
+        columns = list(self.numeric_columns)
+        # category -> column index, or None for the dropped baseline category
+        self._lookups = {}
+        for column in self.categorical_columns:
+            lookup = {}
+            for i, category in enumerate(self.categories[column]):
+                if i == 0:
+                    lookup[category] = None
+                else:
+                    lookup[category] = len(columns)
+                    columns.append(f'{column}_{category}')
+            self._lookups[column] = lookup
+        if self.date_column:
+            columns.extend(DATE_FEATURES)
+        self.feature_columns = columns
+        self.n_features = len(columns)
+
+    def encode(self, records, dtype=np.float64, out=None):
+        """
+        Encode a list of raw transaction dicts.
+        Returns (X, unknown) where X is an (n, n_features) array and unknown
+        lists (row, column, value) for every unseen category.
+        """
+        n = len(records)
+        if out is None:
+            X = np.zeros((n, self.n_features), dtype=dtype)
+        else:
+            X = out[:n]
+            X.fill(0)
+        unknown = []
+        date_slot = self.n_features - len(DATE_FEATURES)
+        
+        for i, record in enumerate(records):
+            row = X[i]
+            for j, column in enumerate(self.numeric_columns):
+                row[j] = float(record[column])
+            for column, lookup in self._lookups.items():
+                value = record.get(column)
+                slot = lookup.get(value, -1)
+                if slot is None:
+                    continue
+                if slot == -1:
+                    if self.handle_unknown == 'error':
+                        raise UnknownCategoryError(f'Unknown {column} {value!r} in row {i}')
+                    unknown.append((i, column, value))
+                    continue
+                row[slot] = 1.0
+            if self.date_column:
+                if self.date_column in record:
+                    d = _parse_date(record[self.date_column])
+                    row[date_slot] = d.month
+                    row[date_slot + 1] = d.weekday()
+                else:
+                    # Already-derived date features are accepted as-is
+                    row[date_slot] = float(record['month'])
+                    row[date_slot + 1] = float(record['day_of_week'])
+        
+        return X, unknown
+
+    def encode_one(self, record, dtype=np.float64):
+        X, unknown = self.encode([record], dtype=dtype)
+        return X[0], unknown
+
+    def encode_frame(self, data, dtype=np.float64):
+        """
+        Vectorized encoding of a whole DataFrame, used for training and bulk
+        scoring. Returns (X, unknown_counts) where unknown_counts maps each
+        categorical column to {value: rows} for unseen categories.
+        """
+        n = len(data)
+        X = np.zeros((n, self.n_features), dtype=dtype)
+        unknown = {}
+        for j, column in enumerate(self.numeric_columns):
+            X[:, j] = data[column].to_numpy(dtype=dtype)
+        rows = np.arange(n)
+        for column, lookup in self._lookups.items():
+            values = data[column].astype(str)
+            codes = pd.Categorical(values, categories=self.categories[column]).codes
+            if (codes == -1).any():
+                unseen = values[codes == -1].value_counts()
+                if self.handle_unknown == 'error':
+                    raise UnknownCategoryError(f'Unknown {column} values: {list(unseen.index)}')
+                unknown[column] = unseen.to_dict()
+            # Column index for each category code; -1 for baseline and unknown
+            slots = np.array([-1 if s is None else s for s in lookup.values()] + [-1])
+            row_slots = slots[codes]
+            hit = row_slots >= 0
+            X[rows[hit], row_slots[hit]] = 1
+        if self.date_column:
+            date_slot = self.n_features - len(DATE_FEATURES)
+            if self.date_column in data.columns:
+                dates = pd.to_datetime(data[self.date_column])
+                X[:, date_slot] = dates.dt.month.to_numpy()
+                X[:, date_slot + 1] = dates.dt.dayofweek.to_numpy()
+            else:
+                X[:, date_slot] = data['month'].to_numpy()
+                X[:, date_slot + 1] = data['day_of_week'].to_numpy()
+        return X, unknown
+
+    def to_dict(self):
+        return {
+            'categorical_columns': self.categorical_columns,
+            'numeric_columns': self.numeric_columns,
+            'date_column': self.date_column,
+            'categories': self.categories,
+            'feature_columns': self.feature_columns,
+        }
+
+    @classmethod
+    def from_dict(cls, state, handle_unknown='report'):
+        encoder = cls(state['categorical_columns'], state['numeric_columns'],
+                      state['date_column'], handle_unknown=handle_unknown)
+        encoder.categories = state['categories']
+        encoder._build_lookups()
+        return encoder
@@ -0,0 +1,385 @@
+"""
+Flattened IsolationForest evaluator for low-latency scoring.
+
+sklearn's decision_function pays a fixed cost per call (input validation,
+a joblib dispatch over the trees, one tree.apply per tree) that dominates
+when scoring one transaction or a handful. FlatForest packs every fitted
+tree into a few contiguous arrays, one entry per node of the whole forest:
+
+    feature    split feature (leaves: 0)
+    threshold  go left when x <= threshold (leaves: +inf)
+    children   (left, right) node index; a leaf points at itself
+    nan_left   where a missing value goes (trees fitted on data with NaN)
+    leaf_value depth + average path length of the leaf's samples - 1
+
+and walks all trees for a whole batch at once, one level per step. A leaf
+pointing at itself lets every path keep stepping until the deepest tree is
+done. The scores match IsolationForest's to float rounding: inputs are
+rounded to float32 like sklearn's trees do, and the per-tree depths are
+summed in the same order.
+
+CascadedForest adds early exit: most transactions are clearly normal, and
+a partial average over the first trees already places them far from the
+anomaly threshold, so only the borderline ones are scored on every tree.
+
+    python forest_evaluator.py            # export forest.npz for models/LATEST and check it
+    python forest_evaluator.py --data transactions.csv --cascade-trees 10,20 --cascade-margins 0.02,0.05
+"""
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+import model_store
+
+# Batches up to this many rows are scored with the FlatForest; above it the
+# per-level work outgrows sklearn's fixed cost and its per-tree C loop wins
+FLAT_MAX_ROWS = 2048
+
+# Cascaded scoring: trees every row is scored on before it may exit early,
+# and how far (in decision_function units) its estimated score must be from
+# the anomaly threshold (0) to exit
+CASCADE_TREES = 20
+CASCADE_MARGIN = 0.05
+
+# Rows walked per step. Each step holds n_estimators x rows node indices,
+# so this bounds the working memory at a few tens of MB
+BATCH_ROWS = 8192
+
+
+def _average_path_length(n):
+    """Average path length of an unsuccessful BST search among n points (c(n) in the paper)."""
+    n = np.asarray(n, dtype=np.float64)
+    result = np.zeros_like(n)
+    result[n == 2] = 1.0
+    large = n > 2
+    result[large] = 2.0 * (np.log(n[large] - 1.0) + np.euler_gamma) - 2.0 * (n[large] - 1.0) / n[large]
+    return result
+
+
+def _node_depths(tree):
+    """Depth of every node of a fitted sklearn tree, counting the root as 1."""
+    depth = np.zeros(tree.node_count)
+    level, nodes = 1, np.array([0])
+    while len(nodes):
+        depth[nodes] = level
+        nodes = nodes[tree.children_left[nodes] != -1]
+        nodes = np.concatenate([tree.children_left[nodes], tree.children_right[nodes]])
+        level += 1
+    return depth
+
+
+class FlatForest:
+    """A fitted IsolationForest as flat node arrays, with its scoring interface."""
+
+    def __init__(self, feature, threshold, children, nan_left, leaf_value, roots, depth,
+                 denominator, offset, n_features):
+        # Stored as int32; walked as intp, which np.take would convert to on every step
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = threshold
+        self.children = np.asarray(children, dtype=np.intp)
+        self.nan_left = nan_left
+        self.leaf_value = leaf_value
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.depth = int(depth)
+        self.denominator = float(denominator)
+        self.offset_ = float(offset)
+        self.n_features_in_ = int(n_features)
+
+    @classmethod
+    def from_model(cls, model):
+        """Pack a fitted sklearn IsolationForest."""
+        if not hasattr(model, 'estimators_features_'):
+            raise ValueError(f"{type(model).__name__} models can't be flattened; "
+                             "only isolation_forest models can")
+        n_features = model.n_features_in_
+        # Like sklearn: trees see a column subset only when max_features < all
+        subsample = model._max_features != n_features
+        features, thresholds, children, nan_left, leaf_values, roots = [], [], [], [], [], []
+        depth, start = 0, 0
+        for estimator, columns in zip(model.estimators_, model.estimators_features_):
+            tree = estimator.tree_
+            leaf = tree.children_left == -1
+            # Leaves hold the sentinel -2, so map only internal nodes to columns
+            feature = np.where(leaf, 0, np.asarray(columns)[np.maximum(tree.feature, 0)] if subsample else tree.feature)
+            threshold = np.where(leaf, np.inf, tree.threshold)
+            own = np.arange(tree.node_count) + start
+            left = np.where(leaf, own, tree.children_left + start)
+            right = np.where(leaf, own, tree.children_right + start)
+            missing = getattr(tree, 'missing_go_to_left', np.ones(tree.node_count, dtype=np.uint8))
+            value = _node_depths(tree) + _average_path_length(tree.n_node_samples) - 1.0
+
+            features.append(feature.astype(np.int32))
+            thresholds.append(threshold)
+            children.append(np.stack([left, right], axis=1).astype(np.int32))
+            nan_left.append(np.asarray(missing, dtype=bool))
+            leaf_values.append(np.where(leaf, value, 0.0))
+            roots.append(start)
+            depth = max(depth, tree.max_depth)
+            start += tree.node_count
+
+        denominator = len(model.estimators_) * _average_path_length([model._max_samples])[0]
+        return cls(np.concatenate(features), np.concatenate(thresholds), np.concatenate(children),
+                   np.concatenate(nan_left), np.concatenate(leaf_values), np.array(roots, dtype=np.int32),
+                   depth, denominator, model.offset_, n_features)
+
+    def save(self, path):
+        # Written via a temporary file so a concurrent loader never sees half of it
+        tmp = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp, feature=self.feature.astype(np.int32), threshold=self.threshold,
+                 children=self.children.astype(np.int32), nan_left=self.nan_left,
+                 leaf_value=self.leaf_value, roots=self.roots.astype(np.int32),
+                 scalars=np.array([self.depth, self.denominator, self.offset_, self.n_features_in_]))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            depth, denominator, offset, n_features = data['scalars']
+            return cls(data['feature'], data['threshold'], data['children'], data['nan_left'],
+                       data['leaf_value'], data['roots'], depth, denominator, offset, n_features)
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    def _depths(self, X, trees, initial):
+        """Leaf values of trees added up (onto initial) for float64 rows X (already rounded to float32)."""
+        n = len(X)
+        flat = X.ravel()
+        has_nan = np.isnan(flat).any()
+        row_start = np.arange(n, dtype=np.intp) * self.n_features_in_
+        # (tree, row) node indices; children is (left, right) pairs, raveled
+        node = np.repeat(self.roots[trees, None], n, axis=1)
+        children = self.children.ravel()
+        for _ in range(self.depth):
+            # np.take is noticeably faster than fancy indexing on 1-D arrays
+            x = np.take(flat, np.take(self.feature, node) + row_start)
+            go_right = x > np.take(self.threshold, node)
+            if has_nan:
+                go_right |= np.isnan(x) & ~np.take(self.nan_left, node)
+            node = np.take(children, 2 * node + go_right)
+        values = np.take(self.leaf_value, node)
+        if initial is not None:
+            values = np.concatenate([initial[None, :], values])
+        # Added tree by tree, the order sklearn adds them in. sum() would use
+        # pairwise summation when there is a single row, which rounds differently
+        return np.cumsum(values, axis=0)[-1]
+
+    def prepare(self, X):
+        """
+        X as float64 rows rounded to float32: sklearn evaluates its trees on
+        float32 inputs and compares them in float64 against the thresholds.
+        """
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has shape {X.shape}, expected (n, {self.n_features_in_})")
+        return X
+
+    def path_lengths(self, X, trees=slice(None), initial=None):
+        """
+        Summed path lengths of prepared rows X over the trees selected by
+        `trees` (a slice), added onto `initial` (the sums over earlier trees).
+        """
+        depths = np.empty(len(X))
+        for start in range(0, len(X), BATCH_ROWS):
+            rows = slice(start, start + BATCH_ROWS)
+            depths[rows] = self._depths(X[rows], trees, None if initial is None else initial[rows])
+        return depths
+
+    def score_from_path_lengths(self, depths, n_trees=None):
+        """
+        score_samples values from summed path lengths over n_trees trees
+        (default: all). Fewer trees give an estimate, scaled up to the forest.
+        """
+        if self.denominator == 0:
+            # A forest fitted on a single sample: sklearn takes the depth
+            # ratio as 1 there, so every score is -2 ** -1
+            return np.full(len(depths), -0.5)
+        scale = self.n_estimators / (n_trees or self.n_estimators)
+        return -(2 ** (-(depths * scale) / self.denominator))
+
+    def score_samples(self, X):
+        """Same as IsolationForest.score_samples: the lower, the more abnormal."""
+        return self.score_from_path_lengths(self.path_lengths(self.prepare(X)))
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+
+class CascadedForest:
+    """
+    Early-exit scoring on a FlatForest. Every row is scored on the first
+    `first_trees` trees. Rows whose estimated score is at least `margin`
+    from the threshold keep that estimate. Only the rest are scored on the
+    remaining trees, which continue the same sums, so their scores equal
+    the full forest's exactly. stats() counts how many rows needed every tree.
+    """
+
+    def __init__(self, forest, first_trees=CASCADE_TREES, margin=CASCADE_MARGIN):
+        if not 0 < first_trees <= forest.n_estimators:
+            raise ValueError(f"first_trees must be between 1 and {forest.n_estimators}, got {first_trees}")
+        self.forest = forest
+        self.first_trees = first_trees
+        self.margin = margin
+        self.offset_ = forest.offset_
+        self.n_features_in_ = forest.n_features_in_
+        self._lock = threading.Lock()
+        self._rows = 0
+        self._rows_full = 0
+
+    def _score(self, X):
+        """(score_samples, mask of the rows scored on every tree)"""
+        forest, first = self.forest, self.first_trees
+        X = forest.prepare(X)
+        depths = forest.path_lengths(X, slice(0, first))
+        scores = forest.score_from_path_lengths(depths, first)
+        full = np.abs(scores - self.offset_) < self.margin
+        if first < forest.n_estimators and full.any():
+            rest = forest.path_lengths(X[full], slice(first, None), depths[full])
+            scores[full] = forest.score_from_path_lengths(rest)
+        with self._lock:
+            self._rows += len(X)
+            self._rows_full += int(full.sum())
+        return scores, full
+
+    def score_samples(self, X):
+        return self._score(X)[0]
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+    def counts(self):
+        """(rows scored, rows scored on every tree) so far."""
+        with self._lock:
+            return self._rows, self._rows_full
+
+    def stats(self):
+        rows, rows_full = self.counts()
+        return cascade_stats(rows, rows_full, self.first_trees, self.forest.n_estimators, self.margin)
+
+
+def cascade_stats(rows, rows_full, first_trees, n_estimators, margin):
+    """Early-exit rate and the share of tree evaluations a cascade saved."""
+    early = rows - rows_full
+    return {
+        'rows': rows,
+        'rows_full': rows_full,
+        'early_exit_rate': early / rows if rows else 0.0,
+        'tree_evaluations_saved': early * (n_estimators - first_trees) / (rows * n_estimators) if rows else 0.0,
+        'first_trees': first_trees,
+        'margin': margin,
+    }
+
+
+def evaluate_cascade(forest, X, first_trees=CASCADE_TREES, margin=CASCADE_MARGIN):
+    """
+    Score X with a cascade and with the full forest and report how well
+    they agree: the share of rows given the same label, the largest score
+    error, the early-exit rate and the tree evaluations saved.
+    """
+    cascade = CascadedForest(forest, first_trees, margin)
+    scores, full = cascade._score(X)
+    reference = forest.score_samples(X)
+    stats = cascade.stats()
+    stats['agreement'] = float(np.mean((scores < forest.offset_) == (reference < forest.offset_))) if len(X) else 1.0
+    stats['max_score_error'] = float(np.abs(scores - reference).max()) if len(X) else 0.0
+    return stats
+
+
+def get_flat_forest(model, model_dir=model_store.MODEL_DIR, version=None):
+    """
+    Return the FlatForest for a model version. It is packed once and cached
+    next to the artifact as forest.npz, so later runs and server workers
+    only load the arrays.
+    """
+    path = os.path.join(model_store.artifact_path(model_dir, version), model_store.FOREST_FILE)
+    if os.path.exists(path):
+        return FlatForest.load(path)
+    forest = FlatForest.from_model(model)
+    try:
+        forest.save(path)
+    except OSError:
+        # A read-only artifact directory: pack it again next time
+        pass
+    return forest
+
+
+def _best_time(function, X, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(X)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _check_rows(args, model_dir, version, n_features):
+    if args.data:
+        from scoring import read_raw_chunks
+        encoder = model_store.load_encoder(model_store.load_metadata(model_dir, version))
+        X, _ = encoder.encode_frame(next(iter(read_raw_chunks(args.data, args.rows))))
+        return X
+    # Background rows resampled and rescaled, so the check also reaches the
+    # sparse, high-amount regions the background alone rarely visits
+    rng = np.random.default_rng(0)
+    background = model_store.load_background(model_dir, version)
+    if background is None:
+        return rng.normal(size=(args.rows, n_features))
+    return background[rng.integers(0, len(background), args.rows)] * rng.lognormal(0, 1, (args.rows, 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a model version's trees as forest.npz and check it")
+    parser.add_argument('--model-dir', default=model_store.MODEL_DIR)
+    parser.add_argument('--version', help="Model version to export (default: LATEST)")
+    parser.add_argument('--data', help="Raw transactions to check on (default: resampled background rows)")
+    parser.add_argument('--rows', type=int, default=10_000, help="Rows to compare the scores on")
+    parser.add_argument('--repeat', type=int, default=20, help="Timing repetitions per batch size")
+    parser.add_argument('--cascade-trees', default='10,20,30',
+                        help="Comma-separated first-stage tree counts to evaluate a cascade with")
+    parser.add_argument('--cascade-margins', default='0.01,0.02,0.05',
+                        help="Comma-separated early-exit margins to evaluate a cascade with")
+    args = parser.parse_args()
+
+    model, metadata = model_store.load_model(args.model_dir, args.version)
+    version = metadata['version']
+    path = os.path.join(model_store.artifact_path(args.model_dir, version), model_store.FOREST_FILE)
+    forest = FlatForest.from_model(model)
+    forest.save(path)
+    print(f"📦 Packed {forest.n_estimators} trees ({len(forest.feature):,} nodes, depth {forest.depth}) "
+          f"into {path}")
+
+    X = _check_rows(args, args.model_dir, version, forest.n_features_in_)
+    difference = np.abs(forest.decision_function(X) - model.decision_function(X)).max()
+    print(f"✅ Largest score difference from sklearn on {len(X):,} rows: {difference:.2e}")
+
+    for size in (1, 10, 100, 1000, 10_000):
+        batch = X[:size]
+        flat = _best_time(forest.decision_function, batch, args.repeat)
+        reference = _best_time(model.decision_function, batch, args.repeat)
+        print(f"  {len(batch):>6,} rows: sklearn {reference * 1e3:8.3f} ms, flat {flat * 1e3:8.3f} ms "
+              f"({reference / flat:5.1f}x)")
+
+    print(f"\n🪜 Cascade vs the full forest on {len(X):,} rows")
+    print(f"  {'trees':>5} {'margin':>7} {'agreement':>10} {'early exit':>11} {'trees saved':>12} {'max error':>10} {'ms':>8}")
+    full_ms = _best_time(forest.decision_function, X, 3) * 1e3
+    for first_trees in [int(t) for t in args.cascade_trees.split(',')]:
+        for margin in [float(m) for m in args.cascade_margins.split(',')]:
+            stats = evaluate_cascade(forest, X, first_trees, margin)
+            ms = _best_time(CascadedForest(forest, first_trees, margin).decision_function, X, 3) * 1e3
+            print(f"  {first_trees:>5} {margin:>7g} {stats['agreement']:>10.4%} {stats['early_exit_rate']:>11.1%} "
+                  f"{stats['tree_evaluations_saved']:>12.1%} {stats['max_score_error']:>10.4f} {ms:>8.1f}")
+    print(f"  {forest.n_estimators:>5} {'-':>7} {1:>10.4%} {0:>11.1%} {0:>12.1%} {0:>10.4f} {full_ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,193 @@
-from flask import Flask, request, jsonify
-import pickle
-import pandas as pd
+from flask import Flask, Response, request, jsonify
+import functools
+import os
+import time
 import numpy as np
-from sklearn.ensemble import IsolationForest
+
+import threading
+
+import model_store
+from explain import ExplanationCache, get_explainer
+from forest_evaluator import CASCADE_MARGIN, FLAT_MAX_ROWS, CascadedForest, get_flat_forest
+from micro_batcher import MicroBatcher
+from server_metrics import BATCH_SIZE_BUCKETS, MetricsRegistry, StageTimer
 
 app = Flask(__name__)
 
-# Train or load model
+# Largest number of rows accepted by /predict_batch in a single call
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 10000))
+
+# Optional micro-batching of /predict: set MICRO_BATCH_WAIT_MS (e.g. 2) to enable
+MICRO_BATCH_WAIT_MS = float(os.environ.get('MICRO_BATCH_WAIT_MS', 0))
+MICRO_BATCH_MAX_SIZE = int(os.environ.get('MICRO_BATCH_MAX_SIZE', 512))
+
+# How to treat agency/recipient_type values not seen in training: 'report' or 'error'
+UNKNOWN_CATEGORIES = os.environ.get('UNKNOWN_CATEGORIES', 'report')
+
+# Entries kept in the /explain LRU cache
+EXPLAIN_CACHE_SIZE = int(os.environ.get('EXPLAIN_CACHE_SIZE', 10000))
+
+# Artifact location; MODEL_VERSION pins a version, otherwise models/LATEST is used
+MODEL_DIR = os.environ.get('MODEL_DIR', model_store.MODEL_DIR)
+MODEL_VERSION = os.environ.get('MODEL_VERSION')
+
+# Score IsolationForest batches of up to FLAT_MAX_ROWS rows with the
+# flattened evaluator (same scores, far lower per-call overhead); 0 disables
+FLAT_FOREST = os.environ.get('FLAT_FOREST', '1') != '0'
+
+# Optional early-exit scoring on the flat forest: score every row on the
+# first CASCADE_TREES trees and finish only those whose estimate is within
+# CASCADE_MARGIN of the threshold. 0 (the default) scores on every tree
+CASCADE_TREES = int(os.environ.get('CASCADE_TREES', 0))
+CASCADE_MARGIN = float(os.environ.get('CASCADE_MARGIN', CASCADE_MARGIN))
+
+# With several gunicorn workers, set METRICS_DIR to a directory shared by them
+# so /metrics reports the whole server instead of the worker that answered
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+
+metrics = MetricsRegistry(METRICS_DIR, METRICS_FLUSH_SECONDS)
+REQUESTS = metrics.counter('anomaly_requests_total', 'Requests by endpoint and HTTP status',
+                           ('endpoint', 'status'))
+ERRORS = metrics.counter('anomaly_request_errors_total', 'Requests that returned an error status',
+                         ('endpoint',))
+REQUEST_SECONDS = metrics.histogram('anomaly_request_seconds', 'Request handling time', ('endpoint',))
+STAGE_SECONDS = metrics.histogram('anomaly_stage_seconds',
+                                  'Time per request stage (decode, encode, score, serialize)',
+                                  ('endpoint', 'stage'))
+BATCH_ROWS = metrics.histogram('anomaly_batch_rows', 'Rows per scored batch', ('endpoint',),
+                               buckets=BATCH_SIZE_BUCKETS)
+MODEL_INFO = metrics.gauge('anomaly_model_info', 'Loaded model version (always 1)', ('version', 'model_class'))
+MODEL_LOAD_SECONDS = metrics.gauge('anomaly_model_load_seconds', 'Time taken to load the model artifact')
+MODEL_LOADED_AT = metrics.gauge('anomaly_model_loaded_timestamp_seconds', 'Unix time the model was loaded')
+
+# Load the model saved by train_model.py
 def load_model():
-    # Either train fresh or load from pickle
-    model = IsolationForest(contamination=0.1, random_state=42)
-    # Add training logic or load from saved file
-    return model
+    # Memory-mapped so gunicorn workers share the artifact's arrays via the page cache
+    return model_store.load_model(MODEL_DIR, MODEL_VERSION, mmap_mode='r')
+
+load_start = time.perf_counter()
+model, model_metadata = load_model()
+encoder = model_store.load_encoder(model_metadata, handle_unknown=UNKNOWN_CATEGORIES)
+MODEL_LOAD_SECONDS.set(value=time.perf_counter() - load_start)
+MODEL_LOADED_AT.set(value=time.time())
+MODEL_INFO.set(model_metadata['version'], model_metadata.get('model_class', ''), value=1)
+
+# Packed from the model (or loaded from its cached forest.npz) at startup;
+# None for detectors other than IsolationForest
+if CASCADE_TREES > 0 and not FLAT_FOREST:
+    raise ValueError("CASCADE_TREES needs the flat forest; unset FLAT_FOREST=0 or CASCADE_TREES")
+if CASCADE_TREES > 0 and not hasattr(model, 'estimators_features_'):
+    raise ValueError(f"CASCADE_TREES only works with IsolationForest models, "
+                     f"model {model_metadata['version']} is a {type(model).__name__}")
+
+flat_forest = None
+cascade = None
+if FLAT_FOREST and hasattr(model, 'estimators_features_'):
+    flat_forest = get_flat_forest(model, MODEL_DIR, model_metadata['version'])
+    if CASCADE_TREES > 0:
+        cascade = CascadedForest(flat_forest, CASCADE_TREES, CASCADE_MARGIN)
+
+def decision_function(X, early_exit=True):
+    """Model scores for X: cascaded, or from the flat forest for small batches."""
+    if cascade is not None and early_exit:
+        return cascade.decision_function(X)
+    if flat_forest is not None and len(X) <= FLAT_MAX_ROWS:
+        return flat_forest.decision_function(X)
+    return model.decision_function(X)
+
+def instrumented(endpoint):
+    """Count a view's requests and errors by status and time the whole call."""
+    def decorate(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            metrics.ensure_flushing()
+            start = time.perf_counter()
+            response = view(*args, **kwargs)
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint)
+            status = response[1] if isinstance(response, tuple) else response.status_code
+            REQUESTS.inc(endpoint, str(status))
+            if status >= 400:
+                ERRORS.inc(endpoint)
+            return response
+        return wrapper
+    return decorate
+
+def score_records(records, timer=None):
+    """
+    Encode transaction dicts straight into a float64 matrix and score it with
+    a single decision_function pass. IsolationForest.predict is just
+    decision_function < 0, so the labels are derived from the scores instead
+    of walking the trees twice.
+    Returns (scores, labels, unknown) where unknown lists (row, field, value).
+    """
+    X, unknown = encoder.encode(records)
+    if timer is not None:
+        timer.mark('encode')
+    scores = decision_function(X)
+    if timer is not None:
+        timer.mark('score')
+    return scores, scores < 0, unknown
+
+def batch_to_records(payload):
+    """
+    Accept either a JSON array of records ([{...}, {...}]) or a columnar
+    object ({"amount": [...], "agency": [...]}) and return a list of records.
+    """
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict):
+        lengths = {}
+        for column, values in payload.items():
+            if not isinstance(values, list):
+                raise ValueError(f"Column '{column}' must be a list of values, got {type(values).__name__}")
+            lengths[column] = len(values)
+        if len(set(lengths.values())) > 1:
+            expected = next(iter(lengths.values()))
+            column = next(c for c, n in lengths.items() if n != expected)
+            raise ValueError(f"Column '{column}' has {lengths[column]} values, expected {expected} "
+                             f"like '{next(iter(lengths))}'")
+        columns = list(payload)
+        return [dict(zip(columns, values)) for values in zip(*payload.values())]
+    raise ValueError('Expected a JSON array of records or an object of columns')
+
+def score_each(records, timer=None):
+    """Micro-batcher callback: one (score, is_anomaly, unknown) tuple per record."""
+    if timer is None:
+        # Called by the micro-batcher thread for a whole batch
+        timer = StageTimer(STAGE_SECONDS, 'micro_batch')
+        BATCH_ROWS.observe(len(records), 'micro_batch')
+    scores, labels, unknown = score_records(records, timer)
+    per_row = [[] for _ in records]
+    for row, field, value in unknown:
+        per_row[row].append((0, field, value))
+    return list(zip(scores.tolist(), labels.tolist(), per_row))
 
-model = load_model()
+def unknown_to_json(unknown, with_row=True):
+    if with_row:
+        return [{'row': row, 'field': field, 'value': value} for row, field, value in unknown]
+    return [{'field': field, 'value': value} for _, field, value in unknown]
+
+batcher = None
+if MICRO_BATCH_WAIT_MS > 0:
+    batcher = MicroBatcher(score_each, max_wait_ms=MICRO_BATCH_WAIT_MS,
+                           max_batch_size=MICRO_BATCH_MAX_SIZE)
+
+# The SHAP explainer is loaded on the first /explain call so that scoring-only
+# workers never import shap
+explainer = None
+explainer_lock = threading.Lock()
+explanation_cache = ExplanationCache(EXPLAIN_CACHE_SIZE)
+
+def load_explainer():
+    global explainer
+    with explainer_lock:
+        if explainer is None:
+            explainer = get_explainer(model, MODEL_DIR, model_metadata['version'])
+    return explainer
 
 @app.route('/predict', methods=['POST'])
+@instrumented('predict')
 def predict_anomaly():
     """
     Endpoint to detect anomalies in transaction data
@@ -23,25 +195,133 @@ def predict_anomaly():
     Output: Anomaly score and classification
     """
     try:
+        timer = StageTimer(STAGE_SECONDS, 'predict')
         data = request.json
-        # Convert to DataFrame for model input
-        df = pd.DataFrame([data])
+        timer.mark('decode')
         
-        # Make prediction
-        anomaly_score = model.decision_function(df)[0]
-        is_anomaly = model.predict(df)[0]
+        # Make prediction, coalesced with concurrent requests when enabled
+        if batcher is not None:
+            anomaly_score, is_anomaly, unknown = batcher.predict(data)
+            # Queueing plus this request's share of the batch's encode and score
+            timer.mark('micro_batch')
+        else:
+            anomaly_score, is_anomaly, unknown = score_each([data], timer)[0]
         
-        return jsonify({
-            'is_anomaly': bool(is_anomaly == -1),
+        result = {
+            'is_anomaly': bool(is_anomaly),
             'anomaly_score': float(anomaly_score),
             'status': 'success'
-        })
+        }
+        if unknown:
+            result['unknown_categories'] = unknown_to_json(unknown, with_row=False)
+        response = jsonify(result)
+        timer.mark('serialize')
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'failed'}), 400
+
+@app.route('/predict_batch', methods=['POST'])
+@instrumented('predict_batch')
+def predict_batch():
+    """
+    Endpoint to score many transactions in one vectorized pass
+    Input: JSON array of transactions, or an object mapping feature -> list
+    Output: Per-row anomaly scores and classifications, in input order
+    """
+    try:
+        timer = StageTimer(STAGE_SECONDS, 'predict_batch')
+        records = batch_to_records(request.json)
+        timer.mark('decode')
+        if len(records) > MAX_BATCH_SIZE:
+            return jsonify({
+                'error': f'Batch of {len(records)} rows exceeds MAX_BATCH_SIZE={MAX_BATCH_SIZE}',
+                'status': 'failed'
+            }), 413
+        if len(records) == 0:
+            return jsonify({'anomaly_scores': [], 'is_anomaly': [], 'count': 0, 'status': 'success'})
+        
+        BATCH_ROWS.observe(len(records), 'predict_batch')
+        scores, labels, unknown = score_records(records, timer)
+        
+        result = {
+            'anomaly_scores': scores.tolist(),
+            'is_anomaly': labels.tolist(),
+            'count': len(records),
+            'anomalies_detected': int(labels.sum()),
+            'status': 'success'
+        }
+        if unknown:
+            result['unknown_categories'] = unknown_to_json(unknown)
+        response = jsonify(result)
+        timer.mark('serialize')
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'failed'}), 400
+
+@app.route('/explain', methods=['POST'])
+@instrumented('explain')
+def explain_transaction():
+    """
+    Endpoint to explain one transaction's anomaly score
+    Input: JSON with transaction features (same as /predict)
+    Output: Score, classification and per-feature SHAP contributions
+    """
+    try:
+        timer = StageTimer(STAGE_SECONDS, 'explain')
+        data = request.json
+        timer.mark('decode')
+        row, unknown = encoder.encode_one(data)
+        timer.mark('encode')
+        key = ExplanationCache.key(model_metadata['version'], row)
+        
+        result = explanation_cache.get(key)
+        cached = result is not None
+        if not cached:
+            X = row.reshape(1, -1)
+            # The exact score, to go with SHAP values of the whole forest
+            anomaly_score = float(decision_function(X, early_exit=False)[0])
+            timer.mark('score')
+            contributions = load_explainer().shap_values(X)[0]
+            timer.mark('shap')
+            result = {
+                'is_anomaly': anomaly_score < 0,
+                'anomaly_score': anomaly_score,
+                # TreeSHAP explains the forest's average path length, not anomaly_score:
+                # base + contributions = this row's path length (longer is more normal)
+                'base_path_length': float(np.ravel(explainer.expected_value)[0]),
+                'path_length_contributions': dict(zip(encoder.feature_columns, contributions.tolist())),
+                'model_version': model_metadata['version'],
+            }
+            explanation_cache.put(key, result)
+        
+        response = dict(result, cached=cached, status='success')
+        if unknown:
+            response['unknown_categories'] = unknown_to_json(unknown, with_row=False)
+        response = jsonify(response)
+        timer.mark('serialize')
+        return response
     except Exception as e:
         return jsonify({'error': str(e), 'status': 'failed'}), 400
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'model': 'loaded'})
+    health = {
+        'status': 'healthy',
+        'model': 'loaded',
+        'model_version': model_metadata['version'],
+        'flat_forest': flat_forest is not None
+    }
+    if batcher is not None:
+        health['micro_batching'] = batcher.stats()
+    if cascade is not None:
+        health['cascade'] = cascade.stats()
+    health['explanation_cache'] = explanation_cache.stats()
+    return jsonify(health)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Request, error, batch-size and per-stage latency metrics in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,109 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-item requests into batches.
+
+    Callers submit one item each and block on a Future. A background thread
+    collects items until `max_batch_size` are waiting or `max_wait_ms` has
+    passed since the first item of the batch arrived, then calls
+    `score_fn(items)` once. The list it returns is in input order and each
+    caller gets its own element.
+
+    The worker thread starts on first use, so the batcher is safe to create
+    before gunicorn forks its workers (--preload).
+    """
+
+    def __init__(self, score_fn, max_wait_ms=2.0, max_batch_size=512):
+        self.score_fn = score_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        # Statistics
+        self._batches = 0
+        self._rows = 0
+        self._largest_batch = 0
+        self._batch_size_buckets = {}
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                # A forked child inherits the object but not the thread
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+
+    def submit(self, item):
+        """Queue one item and return a Future for its result."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def predict(self, item, timeout=None):
+        """Submit one item and wait for its result."""
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.score_fn(items)
+            except Exception:
+                # Don't fail every caller for one bad item: retry one at a time
+                for item, future in batch:
+                    try:
+                        future.set_result(self.score_fn([item])[0])
+                    except Exception as e:
+                        future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            self._record(len(batch))
+
+    def _record(self, size):
+        with self._lock:
+            self._batches += 1
+            self._rows += size
+            self._largest_batch = max(self._largest_batch, size)
+            # Power-of-two buckets: 1, 2, 4, ..., max_batch_size
+            bucket = 1 << (size - 1).bit_length()
+            self._batch_size_buckets[bucket] = self._batch_size_buckets.get(bucket, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': self._batches,
+                'rows': self._rows,
+                'avg_batch_size': self._rows / self._batches if self._batches else 0.0,
+                'largest_batch': self._largest_batch,
+                'batch_size_histogram': {f'<={k}': v for k, v in sorted(self._batch_size_buckets.items())},
+                'max_wait_ms': self.max_wait * 1000.0,
+                'max_batch_size': self.max_batch_size,
+            }
@@ -0,0 +1,114 @@
+import json
+import os
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import sklearn
+
+from features import FeatureEncoder
+
+# Default location of versioned model artifacts:
+#   models/<version>/model.joblib   fitted estimator (uncompressed so it can be memory-mapped)
+#   models/<version>/metadata.json  fitted feature encoder, parameters and training details
+#   models/<version>/background.npy SHAP background sample of encoded training rows
+#   models/<version>/explainer.joblib cached SHAP explainer (built on first use, see explain.py)
+#   models/<version>/forest.npz     IsolationForest trees as flat arrays (built on first use, see forest_evaluator.py)
+#   models/LATEST                   name of the most recently saved version
+MODEL_DIR = 'models'
+MODEL_FILE = 'model.joblib'
+METADATA_FILE = 'metadata.json'
+LATEST_FILE = 'LATEST'
+BACKGROUND_FILE = 'background.npy'
+EXPLAINER_FILE = 'explainer.joblib'
+FOREST_FILE = 'forest.npz'
+
+
+def new_version():
+    return datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+
+
+def save_model(model, encoder, metadata=None, model_dir=MODEL_DIR, version=None, background=None):
+    """
+    Save a fitted model and its fitted FeatureEncoder as a new artifact
+    version and point LATEST at it. `background` is an optional sample of
+    encoded training rows kept for SHAP explanations.
+    Returns the artifact directory.
+    """
+    version = version or new_version()
+    path = os.path.join(model_dir, version)
+    os.makedirs(path, exist_ok=True)
+    
+    # No compression: joblib can only memory-map arrays stored raw
+    joblib.dump(model, os.path.join(path, MODEL_FILE))
+    if background is not None:
+        np.save(os.path.join(path, BACKGROUND_FILE), background)
+    
+    full_metadata = {
+        'version': version,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'model_class': type(model).__name__,
+        'params': {k: v for k, v in model.get_params().items()
+                   if isinstance(v, (int, float, str, bool, type(None)))},
+        'sklearn_version': sklearn.__version__,
+        'feature_columns': list(encoder.feature_columns),
+        'encoder': encoder.to_dict(),
+    }
+    full_metadata.update(metadata or {})
+    with open(os.path.join(path, METADATA_FILE), 'w') as f:
+        json.dump(full_metadata, f, indent=2)
+    
+    # Write LATEST atomically so a loading worker never sees a partial name
+    tmp = os.path.join(model_dir, LATEST_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(model_dir, LATEST_FILE))
+    return path
+
+
+def resolve_version(model_dir=MODEL_DIR, version=None):
+    if version:
+        return version
+    latest = os.path.join(model_dir, LATEST_FILE)
+    if not os.path.exists(latest):
+        raise FileNotFoundError(
+            f"No model artifact found in '{model_dir}'. Run `python train_model.py` first.")
+    with open(latest) as f:
+        return f.read().strip()
+
+
+def artifact_path(model_dir=MODEL_DIR, version=None):
+    return os.path.join(model_dir, resolve_version(model_dir, version))
+
+
+def load_background(model_dir=MODEL_DIR, version=None):
+    """The SHAP background sample saved with a version, or None if there isn't one."""
+    path = os.path.join(artifact_path(model_dir, version), BACKGROUND_FILE)
+    return np.load(path) if os.path.exists(path) else None
+
+
+def load_metadata(model_dir=MODEL_DIR, version=None):
+    version = resolve_version(model_dir, version)
+    with open(os.path.join(model_dir, version, METADATA_FILE)) as f:
+        return json.load(f)
+
+
+def load_encoder(metadata, handle_unknown='report'):
+    """Rebuild the FeatureEncoder saved with an artifact."""
+    if 'encoder' not in metadata:
+        raise ValueError(f"Model {metadata['version']} has no saved encoder; retrain with train_model.py")
+    return FeatureEncoder.from_dict(metadata['encoder'], handle_unknown=handle_unknown)
+
+
+def load_model(model_dir=MODEL_DIR, version=None, mmap_mode='r'):
+    """
+    Load (model, metadata) for a version (default: LATEST).
+
+    With mmap_mode='r' the numpy arrays in the pickle are memory-mapped
+    read-only from the artifact file, so every worker process loading the
+    same version shares one copy through the OS page cache.
+    """
+    metadata = load_metadata(model_dir, version)
+    model = joblib.load(os.path.join(model_dir, metadata['version'], MODEL_FILE),
+                        mmap_mode=mmap_mode)
+    return model, metadata
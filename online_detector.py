@@ -0,0 +1,169 @@
+"""
+Streaming anomaly detector: Half-Space Trees (Tan, Ting & Liu, 2011).
+
+Each tree splits a randomly perturbed copy of the feature space in half,
+level by level, at fixed positions chosen before any data is seen. A node's
+"mass" is how many recent points reached it. Points that land in sparse
+regions are anomalous. Mass is counted over a sliding window: the window
+being filled (latest) is swapped in as the reference profile once full.
+The model therefore follows drift with a cost of one window per update,
+instead of refitting on the whole history.
+
+It has the same scoring interface as IsolationForest (decision_function < 0
+means anomaly, predict returns -1 / 1), so the server, batch_score.py and
+stream_score.py use it unchanged.
+"""
+import numpy as np
+from sklearn.base import BaseEstimator, OutlierMixin
+
+# Rows walked per step. Each step holds (max_depth + 1) x rows x n_estimators
+# node indices and masses, so this bounds the working memory at a few tens of MB
+BATCH_ROWS = 8192
+
+
+class HalfSpaceTrees(OutlierMixin, BaseEstimator):
+    """
+    Parameters
+    ----------
+    n_estimators : number of trees
+    max_depth : levels per tree; each tree has 2 ** (max_depth + 1) - 1 nodes
+    window_size : points per mass window; partial_fit swaps windows every this many rows
+    size_limit : nodes with less reference mass than this end the descent.
+        The paper uses 10% of the window; a small limit lets the deep levels
+        separate the rare large amounts from the bulk of the one-hot features.
+    contamination : share of the latest window treated as anomalous, sets offset_
+    """
+
+    def __init__(self, n_estimators=25, max_depth=12, window_size=10_000, size_limit=10,
+                 contamination=0.05, random_state=None):
+        self.n_estimators = n_estimators
+        self.max_depth = max_depth
+        self.window_size = window_size
+        self.size_limit = size_limit
+        self.contamination = contamination
+        self.random_state = random_state
+
+    def _scale(self, X):
+        # Linear min/max scaling from fit(); amounts far above the training
+        # range land in the outermost, emptiest half-spaces
+        return (np.asarray(X, dtype=np.float64) - self.feature_min_) / self.feature_range_
+
+    def _build_trees(self, n_features, rng):
+        n_trees, depth = self.n_estimators, self.max_depth
+        # Random work space per tree that still covers [0, 1] in every dimension
+        s = rng.random((n_trees, 1, n_features))
+        width = 2 * np.maximum(s, 1 - s)
+        low, high = s - width, s + width
+
+        # Level by level: (tree, node in level, feature) ranges, split at the midpoint
+        self.split_dims_ = rng.integers(0, n_features, (n_trees, 2 ** depth - 1)).astype(np.int32)
+        self.split_values_ = np.empty((n_trees, 2 ** depth - 1))
+        trees = np.arange(n_trees)[:, None]
+        for d in range(depth):
+            nodes = np.arange(2 ** d - 1, 2 ** (d + 1) - 1)
+            position = np.arange(len(nodes))[None, :]
+            dims = self.split_dims_[:, nodes]
+            mid = (low[trees, position, dims] + high[trees, position, dims]) / 2
+            self.split_values_[:, nodes] = mid
+            # Children of the node at position p sit at 2p (left) and 2p + 1 (right)
+            low, high = np.repeat(low, 2, axis=1), np.repeat(high, 2, axis=1)
+            position = np.arange(2 * len(nodes))[None, :]
+            dims, mid = np.repeat(dims, 2, axis=1), np.repeat(mid, 2, axis=1)
+            left = position % 2 == 0
+            high[trees, position, dims] = np.where(left, mid, high[trees, position, dims])
+            low[trees, position, dims] = np.where(left, low[trees, position, dims], mid)
+
+    def _paths(self, Xs):
+        """Node index per (level, row, tree) for scaled rows Xs."""
+        n, n_trees = len(Xs), self.n_estimators
+        rows = np.arange(n)[:, None]
+        trees = np.arange(n_trees)[None, :]
+        node = np.zeros((n, n_trees), dtype=np.int32)
+        paths = np.empty((self.max_depth + 1, n, n_trees), dtype=np.int32)
+        paths[0] = 0
+        for d in range(self.max_depth):
+            dims = self.split_dims_[trees, node]
+            go_right = Xs[rows, dims] >= self.split_values_[trees, node]
+            node = 2 * node + 1 + go_right
+            paths[d + 1] = node
+        return paths
+
+    def _mass(self, Xs):
+        """Per-tree node counts of the paths of scaled rows Xs, BATCH_ROWS rows at a time."""
+        n_nodes = 2 ** (self.max_depth + 1) - 1
+        tree_start = (np.arange(self.n_estimators, dtype=np.int64) * n_nodes)[None, None, :]
+        counts = np.zeros(self.n_estimators * n_nodes, dtype=np.int64)
+        for start in range(0, len(Xs), BATCH_ROWS):
+            flat = self._paths(Xs[start:start + BATCH_ROWS]) + tree_start
+            counts += np.bincount(flat.ravel(), minlength=len(counts))
+        return counts.reshape(self.n_estimators, n_nodes).astype(np.float64)
+
+    def fit(self, X, y=None):
+        """Fix the feature scaling and the trees, and use X as the first reference window."""
+        X = np.asarray(X, dtype=np.float64)
+        rng = np.random.default_rng(self.random_state)
+        self.n_features_in_ = X.shape[1]
+        self.feature_min_ = X.min(axis=0)
+        self.feature_range_ = np.where(np.ptp(X, axis=0) > 0, np.ptp(X, axis=0), 1.0)
+        self._build_trees(self.n_features_in_, rng)
+
+        Xs = self._scale(X)
+        # Scaled to a full window so mass is comparable with later windows
+        self.reference_mass_ = self._mass(Xs) * (self.window_size / len(Xs))
+        self.latest_mass_ = np.zeros_like(self.reference_mass_)
+        self.window_count_ = 0
+        self.windows_seen_ = 1
+        self._window_rows = []
+        self.offset_ = np.quantile(self.score_samples(X), self.contamination)
+        return self
+
+    def partial_fit(self, X, y=None):
+        """
+        Add rows to the latest window. Every window_size rows the latest mass
+        becomes the reference and offset_ is re-estimated from that window.
+        """
+        if not hasattr(self, 'reference_mass_'):
+            return self.fit(X)
+        X = np.asarray(X, dtype=np.float64)
+        start = 0
+        while start < len(X):
+            take = min(len(X) - start, self.window_size - self.window_count_)
+            part = X[start:start + take]
+            self.latest_mass_ += self._mass(self._scale(part))
+            self._window_rows.append(part)
+            self.window_count_ += take
+            start += take
+            if self.window_count_ >= self.window_size:
+                self.reference_mass_ = self.latest_mass_
+                self.latest_mass_ = np.zeros_like(self.reference_mass_)
+                window = np.concatenate(self._window_rows)
+                self.offset_ = np.quantile(self.score_samples(window), self.contamination)
+                self._window_rows = []
+                self.window_count_ = 0
+                self.windows_seen_ += 1
+        return self
+
+    def score_samples(self, X):
+        """
+        Mass-based normality, higher is more normal: per tree the reference
+        mass of the first node on the path holding less than size_limit (or
+        the leaf), times 2 ** depth, summed over trees and log-compressed.
+        """
+        Xs = self._scale(X)
+        trees = np.arange(self.n_estimators)[None, None, :]
+        scores = np.empty(len(Xs))
+        for start in range(0, len(Xs), BATCH_ROWS):
+            mass = self.reference_mass_[trees, self._paths(Xs[start:start + BATCH_ROWS])]
+            small = mass < self.size_limit
+            small[-1] = True
+            depth = np.argmax(small, axis=0)
+            terminal = np.take_along_axis(mass, depth[None], axis=0)[0]
+            scores[start:start + BATCH_ROWS] = np.log1p((terminal * 2.0 ** depth).sum(axis=1) / self.n_estimators)
+        return scores
+
+    def decision_function(self, X):
+        """Negative for anomalies, like IsolationForest.decision_function."""
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
@@ -1,39 +1,110 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+import argparse
 import json
 import os
 
-def prepare_powerbi_data():
-    
-    print("Loading anomaly detection results...")
-    df = pd.read_csv('anomalies_detected.csv')
+from data_io import (read_path, write_table, write_partition, table_path, is_parquet,
+                     count_rows, partition_files, TABLE_FORMATS, column_names, partition_formats)
+from schema import (RISK_LEVELS, MONTH_NAMES, CSV_DTYPES, combine_categories, compact_frame, downcast_int,
+                    report_memory)
+
+# Global SHAP importances written by explain.py
+SHAP_IMPORTANCE_FILE = 'explanations/feature_importance.csv'
+
+# Incremental refresh state, kept inside the output directory:
+#   _state/watermark.json   rows / last payment_date already folded in, batch counter
+#   _state/<partial>.csv    accumulated sums and counts (see partial_aggregates)
+STATE_DIR = '_state'
+WATERMARK_FILE = 'watermark.json'
+
+DAY_MAPPING = {0: 'Monday', 1: 'Tuesday', 2: 'Wednesday', 3: 'Thursday', 
+               4: 'Friday', 5: 'Saturday', 6: 'Sunday'}
+
+
+def derive_columns(df, row_offset=0):
+    """
+    Add the calendar, risk and entity columns the Power BI tables are built
+    from. Without payment_date every row is one synthetic day from
+    2024-01-01; row_offset continues that sequence for incremental batches.
     
-    df['date'] = pd.date_range(start='2024-01-01', periods=len(df), freq='D')
+    The new columns use the compact types of schema.py (categoricals, int8)
+    and the input columns are converted to them at the end.
+    """
+    if 'payment_date' in df.columns:
+        df['date'] = pd.to_datetime(df['payment_date'])
+    else:
+        df['date'] = pd.date_range(start=pd.Timestamp('2024-01-01') + pd.Timedelta(days=row_offset),
+                                   periods=len(df), freq='D')
     
-    df['quarter'] = df['date'].dt.quarter
-    df['year'] = df['date'].dt.year
-    df['month_name'] = df['date'].dt.month_name()
-    df['week_of_year'] = df['date'].dt.isocalendar().week
-    df['hour'] = np.random.randint(0, 24, len(df))
+    dates = df['date'].dt
+    df['quarter'] = downcast_int(dates.quarter, 'int8')
+    df['year'] = downcast_int(dates.year, 'int16')
+    # Month names from the month number: no string per row (-1 codes are missing dates)
+    month_codes = dates.month.fillna(0).to_numpy(dtype=np.int64) - 1
+    df['month_name'] = pd.Categorical.from_codes(month_codes, MONTH_NAMES, ordered=True)
+    df['week_of_year'] = downcast_int(dates.isocalendar().week, 'int8')
+    df['hour'] = np.random.randint(0, 24, len(df)).astype(np.int8)
     
     print("Classifying risk levels...")
-    df['risk_score'] = abs(df['anomaly_score']) * 100
+    df['risk_score'] = abs(df['anomaly_score'].astype(np.float64)) * 100
     
     df['risk_level'] = pd.cut(df['risk_score'], 
                               bins=[0, 1, 2, 5, 100], 
-                              labels=['Low', 'Medium', 'High', 'Critical'])
+                              labels=RISK_LEVELS)
+    
+    # Built from the category codes instead of a string concatenation per row
+    df['entity_name'] = combine_categories(df['agency'], df['recipient_type'])
+    return compact_frame(df)
+
+
+def group_codes(*keys):
+    """
+    Factorize one or more aligned key columns into dense group codes.
+    Groups are numbered in sorted key order (like groupby) and rows with a
+    missing key get -1. Returns (codes, n_groups, unique key arrays).
+    """
+    radix_codes, uniques = [], []
+    for key in keys:
+        codes, values = pd.factorize(key, sort=True)
+        radix_codes.append(codes)
+        uniques.append(np.asarray(values))
     
-    df['entity_name'] = df['agency'] + '_' + df['recipient_type']
+    combined = np.zeros(len(radix_codes[0]), dtype=np.int64)
+    missing = np.zeros(len(combined), dtype=bool)
+    for codes, values in zip(radix_codes, uniques):
+        combined = combined * len(values) + codes
+        missing |= codes < 0
+    combined[missing] = -1
     
+    # Only keep combinations that actually occur, still in sorted order
+    present, codes = np.unique(combined[~missing], return_inverse=True)
+    group_of_row = np.full(len(combined), -1, dtype=np.int64)
+    group_of_row[~missing] = codes
+    
+    key_values = []
+    for values in reversed(uniques):
+        key_values.append(values[present % len(values)])
+        present = present // len(values)
+    return group_of_row, len(key_values[0]), key_values[::-1]
+
+
+def group_sums(codes, n_groups, values):
+    """Per-group (sum, non-null count) of values for rows with codes >= 0."""
+    valid = (codes >= 0) & ~np.isnan(values)
+    sums = np.bincount(codes[valid], weights=values[valid], minlength=n_groups)
+    counts = np.bincount(codes[valid], minlength=n_groups)
+    return sums, counts
+
+
+def details_table(df):
     print("Creating main anomaly details table...")
-    anomaly_details = df[[
+    return df[[
         'entity_name', 'date', 'amount', 'risk_score', 'risk_level',
         'agency', 'recipient_type', 'month', 'day_of_week', 'quarter',
         'year', 'month_name', 'week_of_year', 'hour', 'is_anomaly'
-    ]].copy()
-    
-    anomaly_details = anomaly_details.rename(columns={
+    ]].rename(columns={
         'entity_name': 'Entity',
         'date': 'Date',
         'amount': 'Transaction_Amount',
@@ -50,52 +121,202 @@ def prepare_powerbi_data():
         'hour': 'Hour',
         'is_anomaly': 'Is_Anomaly'
     })
+
+
+def frame_from_details(details):
+    """
+    Inverse of details_table(): rename an anomaly_details table (or a slice
+    of it) back to the derive_columns() names, so its aggregates can be
+    recomputed with partial_aggregates().
+    """
+    df = details.rename(columns={
+        'Entity': 'entity_name',
+        'Date': 'date',
+        'Transaction_Amount': 'amount',
+        'Risk_Score': 'risk_score',
+        'Agency': 'agency',
+        'Recipient_Type': 'recipient_type',
+        'Month': 'month',
+        'Day_of_Week': 'day_of_week',
+        'Quarter': 'quarter',
+        'Year': 'year',
+        'Month_Name': 'month_name',
+        'Week_of_Year': 'week_of_year',
+        'Hour': 'hour',
+        'Is_Anomaly': 'is_anomaly'
+    }).drop(columns='Risk_Level')
+    df['risk_level'] = pd.Categorical(details['Risk_Level'].astype(object), categories=RISK_LEVELS)
+    return df
+
+
+def partial_aggregates(df):
+    """
+    Single aggregation pass: the anomaly mask and the group keys are computed
+    once and every aggregate is built from them with bincount, instead of
+    re-filtering and re-grouping the frame per table.
+
+    Only additive quantities (sums and counts) are kept, so partials from
+    separate batches can be combined with merge_partials() and turned into
+    the output tables by summary_tables().
+    """
+    is_anomaly = (df['is_anomaly'] == 'Anomaly').to_numpy()
+    flagged = df.loc[is_anomaly, ['entity_name', 'year', 'quarter', 'month', 'day_of_week', 'hour',
+                                  'amount', 'risk_score']]
+    amount = flagged['amount'].to_numpy(dtype=np.float64)
+    risk_score = flagged['risk_score'].to_numpy(dtype=np.float64)
+    all_risk = df['risk_score'].to_numpy(dtype=np.float64)
+    
+    risk_codes = df['risk_level'].cat.codes.to_numpy()
+    risk_counts = np.bincount(risk_codes[risk_codes >= 0], minlength=len(RISK_LEVELS))
+    totals = pd.DataFrame([{
+        'transactions': len(df),
+        'anomalies': int(is_anomaly.sum()),
+        'amount_flagged': amount.sum(),
+        'risk_sum': np.nansum(all_risk),
+        'risk_count': int((~np.isnan(all_risk)).sum()),
+        **{level: int(count) for level, count in zip(RISK_LEVELS, risk_counts)}
+    }])
+    
+    codes, n_groups, (years, quarters, months) = group_codes(
+        flagged['year'], flagged['quarter'], flagged['month'])
+    amount_sum, _ = group_sums(codes, n_groups, amount)
+    risk_sum, risk_count = group_sums(codes, n_groups, risk_score)
+    time = pd.DataFrame({
+        'Year': years, 'Quarter': quarters, 'Month': months,
+        'amount_sum': amount_sum, 'risk_sum': risk_sum, 'risk_count': risk_count,
+        'count': np.bincount(codes[codes >= 0], minlength=n_groups)
+    })
+    
+    codes, n_groups, (entities,) = group_codes(flagged['entity_name'])
+    amount_sum, amount_count = group_sums(codes, n_groups, amount)
+    risk_sum, risk_count = group_sums(codes, n_groups, risk_score)
+    entity = pd.DataFrame({
+        'Entity': entities,
+        'amount_sum': amount_sum, 'amount_count': amount_count,
+        'risk_sum': risk_sum, 'risk_count': risk_count
+    })
+    
+    codes, n_groups, (days, hours) = group_codes(flagged['day_of_week'], flagged['hour'])
+    heatmap = pd.DataFrame({
+        'day_of_week': days, 'hour': hours,
+        'count': np.bincount(codes[codes >= 0], minlength=n_groups)
+    })
+    
+    return {'totals': totals, 'time': time, 'entity': entity, 'heatmap': heatmap}
+
+
+# Group keys of each partial aggregate table
+PARTIAL_KEYS = {
+    'totals': [],
+    'time': ['Year', 'Quarter', 'Month'],
+    'entity': ['Entity'],
+    'heatmap': ['day_of_week', 'hour'],
+}
+
+
+def merge_partials(old, new):
+    """Fold the partial aggregates of a new batch into the accumulated ones."""
+    merged = {}
+    for name, keys in PARTIAL_KEYS.items():
+        combined = pd.concat([old[name], new[name]], ignore_index=True)
+        if keys:
+            merged[name] = combined.groupby(keys, sort=True).sum().reset_index()
+        else:
+            merged[name] = combined.sum().to_frame().T
+    return merged
+
+
+def _mean(sums, counts):
+    sums, counts = np.asarray(sums, dtype=np.float64), np.asarray(counts)
+    return np.divide(sums, counts, out=np.full(len(sums), np.nan), where=counts > 0)
+
+
+def summary_tables(partials, verbose=True):
+    """Build the executive, time series, entity, heatmap and risk tables from partial aggregates."""
+    log = print if verbose else (lambda *args: None)
+    totals = partials['totals'].iloc[0]
+    n_total = int(totals['transactions'])
+    n_anomalies = int(totals['anomalies'])
+    risk_counts = [int(totals[level]) for level in RISK_LEVELS]
     
-    print("Creating executive overview metrics...")
+    log("Creating executive overview metrics...")
     exec_metrics = pd.DataFrame([{
-        'Total_Transactions': len(df),
-        'Anomalies_Detected': len(df[df['is_anomaly'] == 'Anomaly']),
-        'Detection_Rate': (len(df[df['is_anomaly'] == 'Anomaly']) / len(df)) * 100,
-        'Average_Risk_Score': df['risk_score'].mean(),
-        'Total_Amount_Flagged': df[df['is_anomaly'] == 'Anomaly']['amount'].sum(),
-        'High_Risk_Count': len(df[df['risk_level'] == 'Critical']),
-        'Medium_Risk_Count': len(df[df['risk_level'] == 'High']),
-        'Low_Risk_Count': len(df[df['risk_level'].isin(['Low', 'Medium'])])
+        'Total_Transactions': n_total,
+        'Anomalies_Detected': n_anomalies,
+        'Detection_Rate': (n_anomalies / n_total) * 100,
+        'Average_Risk_Score': _mean([totals['risk_sum']], [totals['risk_count']])[0],
+        'Total_Amount_Flagged': float(totals['amount_flagged']),
+        'High_Risk_Count': risk_counts[3],
+        'Medium_Risk_Count': risk_counts[2],
+        'Low_Risk_Count': risk_counts[0] + risk_counts[1]
     }])
     
-    print("Creating time series aggregations...")
-    time_series = df[df['is_anomaly'] == 'Anomaly'].groupby(['year', 'quarter', 'month']).agg({
-        'amount': 'sum',
-        'risk_score': 'mean',
-        'is_anomaly': 'count'
-    }).reset_index()
-    
-    time_series = time_series.rename(columns={
-        'amount': 'Total_Amount',
-        'risk_score': 'Avg_Risk_Score',
-        'is_anomaly': 'Anomaly_Count',
-        'year': 'Year',
-        'quarter': 'Quarter',
-        'month': 'Month'
+    log("Creating time series aggregations...")
+    time = partials['time']
+    time_series = pd.DataFrame({
+        'Year': time['Year'],
+        'Quarter': time['Quarter'],
+        'Month': time['Month'],
+        'Total_Amount': time['amount_sum'],
+        'Avg_Risk_Score': _mean(time['risk_sum'], time['risk_count']),
+        'Anomaly_Count': time['count']
     })
     
-    print("Creating entity summary...")
-    entity_summary = df[df['is_anomaly'] == 'Anomaly'].groupby('entity_name').agg({
-        'amount': ['sum', 'mean', 'count'],
-        'risk_score': 'mean'
-    }).reset_index()
+    log("Creating entity summary...")
+    entity = partials['entity']
+    entity_summary = pd.DataFrame({
+        'Entity': entity['Entity'],
+        'Total_Amount': entity['amount_sum'],
+        'Avg_Amount': _mean(entity['amount_sum'], entity['amount_count']),
+        'Anomaly_Count': entity['amount_count'],
+        'Avg_Risk_Score': _mean(entity['risk_sum'], entity['risk_count'])
+    })
+    entity_summary = entity_summary.sort_values('Anomaly_Count', ascending=False, kind='stable')
     
-    entity_summary.columns = ['Entity', 'Total_Amount', 'Avg_Amount', 'Anomaly_Count', 'Avg_Risk_Score']
-    entity_summary = entity_summary.sort_values('Anomaly_Count', ascending=False)
+    log("Creating day-hour heatmap data...")
+    heatmap = partials['heatmap']
+    heatmap_data = pd.DataFrame({
+        'day_of_week': heatmap['day_of_week'],
+        'hour': heatmap['hour'],
+        'Count': heatmap['count']
+    })
+    heatmap_data['Day_Name'] = heatmap_data['day_of_week'].map(DAY_MAPPING)
     
-    print("Creating day-hour heatmap data...")
-    day_mapping = {0: 'Monday', 1: 'Tuesday', 2: 'Wednesday', 3: 'Thursday', 
-                   4: 'Friday', 5: 'Saturday', 6: 'Sunday'}
+    log("Creating risk distribution data...")
+    risk_distribution = pd.DataFrame({'Risk_Level': RISK_LEVELS, 'Count': risk_counts})
+    risk_distribution = risk_distribution.sort_values('Count', ascending=False, kind='stable')
+    risk_distribution['Percentage'] = (risk_distribution['Count'] / risk_distribution['Count'].sum()) * 100
     
-    heatmap_data = df[df['is_anomaly'] == 'Anomaly'].groupby(['day_of_week', 'hour']).size().reset_index(name='Count')
-    heatmap_data['Day_Name'] = heatmap_data['day_of_week'].map(day_mapping)
+    tables = {
+        'executive_metrics': exec_metrics,
+        'time_series': time_series,
+        'entity_summary': entity_summary,
+        'heatmap_data': heatmap_data,
+        'risk_distribution': risk_distribution,
+    }
+    stats = {
+        'total_transactions': n_total,
+        'anomalies_detected': n_anomalies,
+        'detection_rate': (n_anomalies / n_total) * 100,
+    }
+    return tables, stats
+
+
+def build_powerbi_tables(df, feature_importance):
+    """Build all seven Power BI tables from a derived frame. Returns (tables, stats)."""
+    anomaly_details = details_table(df)
+    summaries, stats = summary_tables(partial_aggregates(df))
+    tables = {'anomaly_details': anomaly_details, **summaries, 'feature_importance': feature_importance}
+    stats['files_created'] = len(tables)
+    return tables, stats
+
+
+def load_feature_importance():
+    if os.path.exists(SHAP_IMPORTANCE_FILE):
+        print(f"Loading feature importance data (SHAP values from {SHAP_IMPORTANCE_FILE})...")
+        return pd.read_csv(SHAP_IMPORTANCE_FILE)
     
-    print("Creating feature importance data (simulated SHAP values)...")
+    print("Creating feature importance data (simulated SHAP values, run explain.py for real ones)...")
     features = ['Transaction Amount', 'Agency Type', 'Recipient Type', 'Time of Day', 
                 'Day of Week', 'Historical Pattern', 'Seasonal Factor', 'Entity Risk Profile']
     
@@ -107,40 +328,187 @@ def prepare_powerbi_data():
     feature_importance = feature_importance.sort_values('Importance', ascending=False)
     feature_importance['Importance_Percentage'] = (feature_importance['Importance'] / 
                                                    feature_importance['Importance'].sum()) * 100
+    return feature_importance
+
+
+def load_state(output_dir):
+    """Return (watermark, partials) from the last incremental run, or (None, None)."""
+    state_dir = os.path.join(output_dir, STATE_DIR)
+    watermark_path = os.path.join(state_dir, WATERMARK_FILE)
+    if not os.path.exists(watermark_path):
+        return None, None
+    with open(watermark_path) as f:
+        watermark = json.load(f)
+    partials = {name: pd.read_csv(os.path.join(state_dir, f'{name}.csv')) for name in PARTIAL_KEYS}
+    return watermark, partials
+
+
+def save_state(output_dir, watermark, partials):
+    state_dir = os.path.join(output_dir, STATE_DIR)
+    os.makedirs(state_dir, exist_ok=True)
+    for name, partial in partials.items():
+        partial.to_csv(os.path.join(state_dir, f'{name}.csv'), index=False)
+    # The watermark goes last so an interrupted run is simply redone
+    tmp = os.path.join(state_dir, WATERMARK_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(watermark, f, indent=2)
+    os.replace(tmp, os.path.join(state_dir, WATERMARK_FILE))
+
+
+def read_new_rows(path, watermark, mode):
+    """
+    Rows of the scored input that are past the watermark. mode='rows' treats
+    the input as append-only and skips the rows already processed;
+    mode='date' keeps rows whose payment_date is after the last one seen.
+    """
+    rows_done = watermark['rows_processed'] if watermark else 0
+    last_date = watermark.get('last_date') if watermark else None
     
-    print("Creating risk distribution data...")
-    risk_distribution = df['risk_level'].value_counts().reset_index()
-    risk_distribution.columns = ['Risk_Level', 'Count']
-    risk_distribution['Percentage'] = (risk_distribution['Count'] / risk_distribution['Count'].sum()) * 100
+    if os.path.isdir(path):
+        # Partitioned input (e.g. the stream_score.py store), parts in append order
+        frames = []
+        for part in partition_files(path):
+            if mode == 'rows':
+                n_rows = count_rows(part)
+                if rows_done >= n_rows:
+                    rows_done -= n_rows
+                    continue
+            frames.append(read_new_rows(part, {'rows_processed': rows_done, 'last_date': last_date}, mode))
+            rows_done = 0
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
     
-    print("Exporting data for Power BI...")
+    if mode == 'rows':
+        if is_parquet(path):
+            import pyarrow.parquet as pq
+            return pq.read_table(path).slice(rows_done).to_pandas()
+        return pd.read_csv(path, skiprows=range(1, rows_done + 1), dtype=CSV_DTYPES)
     
-    if not os.path.exists('powerbi_data'):
-        os.makedirs('powerbi_data')
+    if is_parquet(path):
+        filters = [('payment_date', '>', pd.Timestamp(last_date))] if last_date else None
+        return pd.read_parquet(path, filters=filters)
+    df = pd.read_csv(path, parse_dates=['payment_date'], dtype=CSV_DTYPES)
+    return df[df['payment_date'] > pd.Timestamp(last_date)] if last_date else df
+
+
+def prepare_powerbi_data(input_path=None, output_dir='powerbi_data', formats=('csv',),
+                         incremental=False, watermark_mode='rows'):
+    """
+    Build the seven Power BI tables from the scored transactions.
+    input_path defaults to anomalies_detected.parquet if present, else an
+    anomalies_detected/ directory of part files, else anomalies_detected.csv.
+    formats: any of 'csv' and 'parquet'; Parquet keeps categoricals as
+    dictionary columns and dates as native timestamps.
+    
+    With incremental=True only rows past the saved watermark are processed.
+    Their details are written as a new anomaly_details/part-<batch> partition.
+    Their partial aggregates are folded into the saved ones, and the small
+    summary tables are rewritten from the result, so a daily refresh costs
+    time proportional to one day of data.
+    """
+    if input_path is None:
+        input_path = table_path('.', 'anomalies_detected')
+    
+    if incremental:
+        return _prepare_incremental(input_path, output_dir, formats, watermark_mode)
+    
+    print("Loading anomaly detection results...")
+    df = read_path(input_path, dtype=CSV_DTYPES)
+    report_memory(df, "loaded")
+    df = derive_columns(df)
+    report_memory(df, "derived")
     
-    anomaly_details.to_csv('powerbi_data/anomaly_details.csv', index=False)
-    exec_metrics.to_csv('powerbi_data/executive_metrics.csv', index=False)
-    time_series.to_csv('powerbi_data/time_series.csv', index=False)
-    entity_summary.to_csv('powerbi_data/entity_summary.csv', index=False)
-    heatmap_data.to_csv('powerbi_data/heatmap_data.csv', index=False)
-    feature_importance.to_csv('powerbi_data/feature_importance.csv', index=False)
-    risk_distribution.to_csv('powerbi_data/risk_distribution.csv', index=False)
+    tables, stats = build_powerbi_tables(df, load_feature_importance())
+    report_memory(tables['anomaly_details'], "anomaly_details")
+    
+    print(f"Exporting data for Power BI ({', '.join(formats)})...")
+    
+    for name, table in tables.items():
+        write_table(table, output_dir, name, formats)
+    # A full rebuild invalidates any incremental state
+    if os.path.isdir(os.path.join(output_dir, STATE_DIR)):
+        for name in os.listdir(os.path.join(output_dir, STATE_DIR)):
+            os.remove(os.path.join(output_dir, STATE_DIR, name))
     
     print("\n✅ Data preparation complete!")
-    print(f"📊 Generated {len(anomaly_details)} records for analysis")
-    print(f"📁 Data files saved in 'powerbi_data' directory")
-    
-    return {
-        'total_transactions': len(df),
-        'anomalies_detected': len(df[df['is_anomaly'] == 'Anomaly']),
-        'detection_rate': (len(df[df['is_anomaly'] == 'Anomaly']) / len(df)) * 100,
-        'files_created': 7
-    }
+    print(f"📊 Generated {len(tables['anomaly_details'])} records for analysis")
+    print(f"📁 Data files saved in '{output_dir}' directory")
+    
+    return stats
+
+
+def _prepare_incremental(input_path, output_dir, formats, watermark_mode):
+    watermark, partials = load_state(output_dir)
+    if watermark and watermark['mode'] != watermark_mode:
+        raise ValueError(f"Existing state uses the '{watermark['mode']}' watermark; "
+                         f"run a full refresh to switch to '{watermark_mode}'")
+    if watermark_mode == 'date' and 'payment_date' not in column_names(input_path):
+        raise ValueError(f"--watermark date needs a payment_date column, which {input_path} "
+                         "doesn't have; use --watermark rows")
+    existing = partition_formats(output_dir, 'anomaly_details')
+    if watermark and existing and existing != set(formats):
+        # Readers prefer the Parquet parts, so parts in only one format would be lost
+        raise ValueError(f"Existing anomaly_details partitions are {', '.join(sorted(existing))}; "
+                         f"run incremental refreshes with the same --format, or a full refresh to switch")
+    
+    print("Loading new anomaly detection results...")
+    df = read_new_rows(input_path, watermark, watermark_mode)
+    if len(df) == 0:
+        print("No new rows since the last refresh; outputs are up to date.")
+        totals = partials['totals'].iloc[0] if partials else {'transactions': 0, 'anomalies': 0}
+        n_total, n_anomalies = int(totals['transactions']), int(totals['anomalies'])
+        return {
+            'total_transactions': n_total,
+            'anomalies_detected': n_anomalies,
+            'detection_rate': (n_anomalies / n_total) * 100 if n_total else 0.0,
+            'files_created': 0
+        }
+    
+    rows_done = watermark['rows_processed'] if watermark else 0
+    batch = watermark['batches'] if watermark else 0
+    report_memory(df, "loaded")
+    df = derive_columns(df, row_offset=rows_done)
+    report_memory(df, "derived")
+    
+    new_partials = partial_aggregates(df)
+    partials = merge_partials(partials, new_partials) if partials else new_partials
+    summaries, stats = summary_tables(partials)
+    
+    print(f"Exporting batch {batch} for Power BI ({', '.join(formats)})...")
+    write_partition(details_table(df), output_dir, 'anomaly_details', f'{batch:06d}', formats)
+    for name, table in {**summaries, 'feature_importance': load_feature_importance()}.items():
+        write_table(table, output_dir, name, formats)
+    
+    save_state(output_dir, {
+        'mode': watermark_mode,
+        'rows_processed': rows_done + len(df),
+        'last_date': df['date'].max().isoformat() if watermark_mode == 'date' else None,
+        'batches': batch + 1,
+        'updated_at': datetime.now().isoformat(),
+    }, partials)
+    
+    print("\n✅ Incremental refresh complete!")
+    print(f"📊 Folded in {len(df):,} new records (batch {batch})")
+    print(f"📁 Data files saved in '{output_dir}' directory")
+    stats['files_created'] = len(summaries) + 2
+    return stats
 
 if __name__ == "__main__":
-    stats = prepare_powerbi_data()
+    parser = argparse.ArgumentParser(description="Prepare anomaly results for Power BI and the dashboards")
+    parser.add_argument('--input', help="Scored transactions, a file or a directory of part files "
+                                        "(default: anomalies_detected.parquet, anomalies_detected/ or .csv)")
+    parser.add_argument('--output-dir', default='powerbi_data')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'both'], default='csv',
+                        help="Table format; readers prefer Parquet when both exist")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only fold in rows past the saved watermark instead of recomputing everything")
+    parser.add_argument('--watermark', choices=['rows', 'date'], default='rows',
+                        help="Incremental watermark: row count of an append-only input, or last payment_date")
+    args = parser.parse_args()
+    formats = TABLE_FORMATS if args.format == 'both' else (args.format,)
+    
+    stats = prepare_powerbi_data(args.input, args.output_dir, formats, args.incremental, args.watermark)
     print("\nSummary Statistics:")
     print(f"- Total Transactions: {stats['total_transactions']:,}")
     print(f"- Anomalies Detected: {stats['anomalies_detected']:,}")
     print(f"- Detection Rate: {stats['detection_rate']:.2f}%")
-    print(f"- Files Created: {stats['files_created']}")
\ No newline at end of file
+    print(f"- Files Created: {stats['files_created']}")
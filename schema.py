@@ -0,0 +1,135 @@
+"""
+Compact column types for the scored transactions and the reporting tables.
+
+Repetitive strings (agency, recipient type, entity, risk level, month name,
+anomaly flag) are pandas categoricals: one small integer code per row
+instead of a Python string. Calendar fields are int8/int16. Amounts and
+scores stay float64, since they are aggregated and exported and float32
+would change the written values. The same rules apply under the
+derive_columns() names and under the anomaly_details names
+powerbi_data_preparation.py exports.
+"""
+import numpy as np
+import pandas as pd
+
+RISK_LEVELS = ['Low', 'Medium', 'High', 'Critical']
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+               'August', 'September', 'October', 'November', 'December']
+
+# Column kind by derive_columns() name
+COLUMN_KINDS = {
+    'agency': 'category',
+    'recipient_type': 'category',
+    'entity_name': 'category',
+    'risk_level': 'risk_level',
+    'month_name': 'month_name',
+    'is_anomaly': 'category',
+    'month': 'int8',
+    'day_of_week': 'int8',
+    'hour': 'int8',
+    'quarter': 'int8',
+    'week_of_year': 'int8',
+    'year': 'int16',
+}
+
+# anomaly_details column -> derive_columns() name
+DETAILS_ALIASES = {
+    'Entity': 'entity_name',
+    'Risk_Level': 'risk_level',
+    'Agency': 'agency',
+    'Recipient_Type': 'recipient_type',
+    'Month': 'month',
+    'Day_of_Week': 'day_of_week',
+    'Quarter': 'quarter',
+    'Year': 'year',
+    'Month_Name': 'month_name',
+    'Week_of_Year': 'week_of_year',
+    'Hour': 'hour',
+    'Is_Anomaly': 'is_anomaly',
+}
+
+INTEGER_RANGES = {'int8': (-128, 127), 'int16': (-32768, 32767)}
+
+
+def column_kind(name):
+    return COLUMN_KINDS.get(DETAILS_ALIASES.get(name, name))
+
+
+# read_csv dtype mapping that parses the categorical columns straight into
+# categoricals (both naming schemes; read_csv ignores absent columns)
+CSV_DTYPES = {name: 'category' for name in list(COLUMN_KINDS) + list(DETAILS_ALIASES)
+              if column_kind(name) == 'category'}
+
+
+def to_category(series, categories=None, ordered=False):
+    if categories is None:
+        if isinstance(series.dtype, pd.CategoricalDtype) and not series.dtype.ordered:
+            return series
+        return series.astype('category')
+    dtype = pd.CategoricalDtype(categories, ordered=ordered)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.set_categories(categories, ordered=ordered) if series.dtype != dtype else series
+    return series.astype(dtype)
+
+
+def downcast_int(series, kind):
+    """Narrow an integer column, unless it has missing values or doesn't fit."""
+    low, high = INTEGER_RANGES[kind]
+    if series.dtype == kind or not pd.api.types.is_numeric_dtype(series) or series.isna().any():
+        return series
+    if len(series) and (series.min() < low or series.max() > high):
+        return series
+    return series.astype(kind)
+
+
+def combine_categories(left, right, sep='_'):
+    """
+    left + sep + right for two categorical-like columns, built from their
+    category codes instead of one string concatenation per row. The result
+    is a categorical whose categories are the observed combinations in
+    sorted order; a missing side gives a missing value.
+    """
+    left, right = to_category(left), to_category(right)
+    names = np.array([f'{a}{sep}{b}' for a in left.cat.categories for b in right.cat.categories], dtype=object)
+    if len(set(names)) < len(names):
+        # Ambiguous joins (e.g. 'A_B' + 'C' and 'A' + 'B_C'): fall back to strings
+        return (left.astype(object) + sep + right.astype(object)).astype('category')
+    left_codes = left.cat.codes.to_numpy(dtype=np.int64)
+    right_codes = right.cat.codes.to_numpy(dtype=np.int64)
+    codes = left_codes * len(right.cat.categories) + right_codes
+    codes[(left_codes < 0) | (right_codes < 0)] = -1
+    order = np.argsort(names, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    codes = np.where(codes >= 0, rank[np.maximum(codes, 0)], -1)
+    combined = pd.Categorical.from_codes(codes, categories=names[order]).remove_unused_categories()
+    return pd.Series(combined, index=left.index)
+
+
+def compact_frame(df):
+    """Convert the known categorical and integer columns of df to their compact types, in place. Returns df."""
+    for name in df.columns:
+        kind = column_kind(name)
+        if kind is None:
+            continue
+        series = df[name]
+        if kind == 'category':
+            converted = to_category(series)
+        elif kind == 'risk_level':
+            converted = to_category(series, RISK_LEVELS, ordered=True)
+        elif kind == 'month_name':
+            converted = to_category(series, MONTH_NAMES, ordered=True)
+        else:
+            converted = downcast_int(series, kind)
+        if converted is not series:
+            df[name] = converted
+    return df
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def report_memory(df, stage, log=print):
+    """Log the in-memory size of df after a pipeline stage."""
+    log(f"  💾 {stage}: {len(df):,} rows x {len(df.columns)} columns, {memory_mb(df):,.1f} MB")
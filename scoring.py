@@ -0,0 +1,39 @@
+import numpy as np
+
+from data_io import iter_chunks, is_parquet, CHUNKSIZE
+from features import CATEGORICAL_COLUMNS, DATE_COLUMN
+
+# Column layout of the notebook's anomalies_detected.csv, read by
+# powerbi_data_preparation.py and streamlit_app.py. payment_date is kept
+# at the end when the input has it, for real dates and date watermarks.
+OUTPUT_COLUMNS = ['agency', 'recipient_type', 'amount', 'anomaly_score', 'is_anomaly',
+                  'month', 'day_of_week', DATE_COLUMN]
+
+# Compact dtypes for streamed raw chunks; amount stays float64 so it is
+# written back unchanged, the encoded matrix is float32
+RAW_DTYPES = {column: 'category' for column in CATEGORICAL_COLUMNS}
+
+
+def read_raw_chunks(path, chunksize=CHUNKSIZE):
+    """Stream raw transactions from a CSV or Parquet file with compact dtypes."""
+    parse_dates = None if is_parquet(path) else [DATE_COLUMN]
+    return iter_chunks(path, chunksize, dtype=RAW_DTYPES, parse_dates=parse_dates)
+
+
+def score_chunk(model, encoder, chunk, dtype=np.float32):
+    """
+    Encode and score one chunk of raw transactions and return it in the
+    anomalies_detected.csv layout. float32 is what sklearn's trees evaluate
+    in, so encoding straight to it avoids a float64 copy per chunk.
+    """
+    X, _ = encoder.encode_frame(chunk, dtype=dtype)
+    scores = model.decision_function(X)
+    
+    scored = chunk[[c for c in encoder.categorical_columns + encoder.numeric_columns + [DATE_COLUMN]
+                    if c in chunk.columns]].copy()
+    scored['anomaly_score'] = scores
+    scored['is_anomaly'] = np.where(scores < 0, 'Anomaly', 'Normal')
+    # month / day_of_week are the last two encoded features
+    scored['month'] = X[:, -2].astype(np.int8)
+    scored['day_of_week'] = X[:, -1].astype(np.int8)
+    return scored[[c for c in OUTPUT_COLUMNS if c in scored.columns]]
@@ -0,0 +1,307 @@
+"""
+Dependency-free Prometheus metrics for inference_server.py: counters,
+gauges and histograms, rendered in the Prometheus text exposition format
+by the /metrics route. Recording happens on every request, so it is kept
+to plain dict and list updates on per-thread storage.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+
+# Latency buckets in seconds, fine at the low end where per-stage times sit
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Rows per scored batch: powers of two, like the micro-batcher's histogram
+BATCH_SIZE_BUCKETS = tuple(2 ** i for i in range(15))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Sharded:
+    """
+    Per-thread storage: each thread updates its own dict, so recording takes
+    no lock; snapshots merge the shards of every thread that has recorded.
+    When a thread has exited, its shard is folded into one shared total and
+    dropped, so a server that starts a thread per request keeps a bounded
+    number of shards.
+    """
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._fold_exited()
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _fold_exited(self):
+        """Fold the shards of exited threads into _retired. Call with the lock held."""
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                # Its thread is gone, so nothing writes to it any more
+                for labels, value in shard.items():
+                    self._fold(labels, value)
+        self._shards = live
+
+    def _shard_items(self):
+        with self._lock:
+            self._fold_exited()
+            items = self._snapshot_retired()
+            shards = [shard for _, shard in self._shards]
+        # list() copies a dict atomically with respect to other Python threads
+        return items + [item for shard in shards for item in list(shard.items())]
+
+
+class Counter(_Sharded):
+    """Monotonic count per label combination (labels passed positionally)."""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def _fold(self, labels, value):
+        self._retired[labels] = self._retired.get(labels, 0) + value
+
+    def _snapshot_retired(self):
+        return list(self._retired.items())
+
+    def snapshot(self):
+        return self.merge([[[list(labels), value] for labels, value in self._shard_items()]])
+
+    @staticmethod
+    def merge(snapshots):
+        merged = {}
+        for snapshot in snapshots:
+            for labels, value in snapshot:
+                merged[tuple(labels)] = merged.get(tuple(labels), 0) + value
+        return [[list(labels), value] for labels, value in merged.items()]
+
+    def render(self, snapshot):
+        return [f'{self.name}{_label_text(self.labelnames, labels)} {_number(value)}'
+                for labels, value in sorted(snapshot)]
+
+
+class Gauge(Counter):
+    """Last value set per label combination. Not summed across workers."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+    @staticmethod
+    def merge(snapshots):
+        return snapshots[0] if snapshots else []
+
+
+class Histogram(_Sharded):
+    """
+    Bucketed observations per label combination. observe() is one bisect
+    and three additions on the calling thread's shard, well under a
+    microsecond.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        shard = self._shard()
+        series = shard.get(labels)
+        if series is None:
+            # Per-bucket (not cumulative) counts, the last one is +Inf
+            series = shard[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def _fold(self, labels, series):
+        counts, total, count = series
+        retired = self._retired.get(labels)
+        if retired is None:
+            self._retired[labels] = [list(counts), total, count]
+        else:
+            retired[0] = [a + b for a, b in zip(retired[0], counts)]
+            retired[1] += total
+            retired[2] += count
+
+    def _snapshot_retired(self):
+        return [(labels, [list(counts), total, count]) for labels, (counts, total, count) in self._retired.items()]
+
+    def snapshot(self):
+        return self.merge([[[list(labels), list(counts), total, count]
+                            for labels, (counts, total, count) in self._shard_items()]])
+
+    @staticmethod
+    def merge(snapshots):
+        merged = {}
+        for snapshot in snapshots:
+            for labels, counts, total, count in snapshot:
+                key = tuple(labels)
+                if key not in merged:
+                    merged[key] = [list(counts), total, count]
+                else:
+                    series = merged[key]
+                    series[0] = [a + b for a, b in zip(series[0], counts)]
+                    series[1] += total
+                    series[2] += count
+        return [[list(labels), counts, total, count] for labels, (counts, total, count) in merged.items()]
+
+    def render(self, snapshot):
+        lines = []
+        for labels, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_label_text(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_label_text(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_label_text(self.labelnames, labels)} {count}')
+        return lines
+
+
+class StageTimer:
+    """
+    Times consecutive stages of one request: mark(stage) records the time
+    since the previous mark (or since the timer was created).
+    """
+
+    def __init__(self, histogram, endpoint):
+        self.histogram = histogram
+        self.endpoint = endpoint
+        self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.histogram.observe(now - self.last, self.endpoint, stage)
+        self.last = now
+
+
+class MetricsRegistry:
+    """
+    The server's metrics, rendered in the Prometheus text format.
+
+    Each gunicorn worker has its own registry. With `directory` set, every
+    worker saves a snapshot there every `flush_seconds` (and when it serves
+    /metrics) and render() sums the snapshots of all workers, so a scrape
+    that lands on any worker sees the whole server. Snapshots of workers
+    that have exited are kept, so counters never go backwards.
+    """
+
+    def __init__(self, directory=None, flush_seconds=5.0):
+        self.metrics = []
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def _snapshot_path(self):
+        return os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+
+    def save(self):
+        tmp = self._snapshot_path() + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, self._snapshot_path())
+
+    def ensure_flushing(self):
+        """Start this process's flush thread (after a fork, the child's own)."""
+        if self.directory is None or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                os.makedirs(self.directory, exist_ok=True)
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._flush, name='metrics-flush', daemon=True)
+                self._thread.start()
+
+    def _flush(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.save()
+
+    def _all_snapshots(self):
+        own = self.snapshot()
+        if self.directory is None:
+            return [own]
+        self.save()
+        snapshots = [own]
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.json') and path != self._snapshot_path():
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return snapshots
+
+    def render(self):
+        snapshots = self._all_snapshots()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render(metric.merge([s.get(metric.name, []) for s in snapshots])))
+        return '\n'.join(lines) + '\n'
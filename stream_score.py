@@ -0,0 +1,289 @@
+"""
+Continuous scoring: read transactions as they arrive, score them in
+fixed-size batches with the saved model and append the flagged rows to a
+partitioned anomalies_detected/ store.
+
+Sources:
+    stdin (NDJSON, one transaction per line)    python stream_score.py
+    a file (NDJSON, CSV or Parquet)             python stream_score.py --input day.ndjson
+    a directory, picking up new files           python stream_score.py --watch incoming/
+
+Memory stays bounded by the batch size whatever the input volume.
+
+With --update an online model (train_model.py --detector half_space_trees)
+keeps learning: each batch is scored first, then added to the model's
+window, and --save-every saves the updated model as a new version.
+powerbi_data_preparation.py reads the store directly (including
+--incremental runs) because it is the part-file layout read_table() loads.
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_io import PartitionedWriter
+from features import DATE_COLUMN
+from scoring import score_chunk, read_raw_chunks
+import model_store
+
+STORE_NAME = 'anomalies_detected'
+
+# Transactions scored per model call
+BATCH_SIZE = 10_000
+
+# Flagged rows per committed part file
+ROWS_PER_PART = 500_000
+
+# Score a partial batch from stdin after this long without a full one
+MAX_WAIT_SECONDS = 5.0
+
+# Commit the open part at least this often, so readers see recent rows
+COMMIT_SECONDS = 60.0
+
+# How often --watch looks for new files
+POLL_SECONDS = 10.0
+
+# With --update, save the updated model after this many more transactions
+SAVE_EVERY = 1_000_000
+
+# Files already scored by --watch, kept inside the store directory
+STATE_FILE = '_stream_state.json'
+
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl', '.json')
+INPUT_EXTENSIONS = NDJSON_EXTENSIONS + ('.csv', '.parquet', '.pq')
+
+
+def records_to_frame(records):
+    df = pd.DataFrame.from_records(records)
+    if DATE_COLUMN in df.columns:
+        df[DATE_COLUMN] = pd.to_datetime(df[DATE_COLUMN])
+    return df
+
+
+def iter_ndjson_batches(stream, batch_size=BATCH_SIZE, max_wait=MAX_WAIT_SECONDS, idle=None):
+    """
+    Yield DataFrames of at most batch_size transactions from an NDJSON
+    stream. A reader thread feeds a bounded queue, so a quiet stream still
+    gets its partial batch scored after max_wait seconds. With idle set, an
+    empty DataFrame is yielded after idle seconds without new lines, so the
+    consumer can still commit on time.
+    """
+    lines = queue.Queue(maxsize=batch_size * 2)
+    done = object()
+
+    def read():
+        for line in stream:
+            if line.strip():
+                lines.put(line)
+        lines.put(done)
+
+    threading.Thread(target=read, daemon=True).start()
+    records, deadline = [], None
+    while True:
+        timeout = idle if deadline is None else max(deadline - time.monotonic(), 0)
+        try:
+            line = lines.get(timeout=timeout)
+        except queue.Empty:
+            line = None
+        if line is done:
+            break
+        if line is not None:
+            records.append(json.loads(line))
+            deadline = deadline or time.monotonic() + max_wait
+        if records and (len(records) >= batch_size or line is None):
+            yield records_to_frame(records)
+            records, deadline = [], None
+        elif line is None:
+            yield pd.DataFrame()
+    if records:
+        yield records_to_frame(records)
+
+
+def iter_file_batches(path, batch_size=BATCH_SIZE):
+    """Batches of at most batch_size transactions from an NDJSON, CSV or Parquet file."""
+    if path.endswith(NDJSON_EXTENSIONS):
+        for chunk in pd.read_json(path, lines=True, chunksize=batch_size):
+            if DATE_COLUMN in chunk.columns:
+                chunk[DATE_COLUMN] = pd.to_datetime(chunk[DATE_COLUMN])
+            yield chunk
+    else:
+        yield from read_raw_chunks(path, batch_size)
+
+
+class StreamScorer:
+    """
+    Scores batches with one model version and appends them to the store.
+    Only anomalies are kept unless anomalies_only is False.
+
+    With update=True the model's partial_fit() is fed every batch after it
+    is scored, and every save_every transactions the model is saved as a
+    new version (which becomes LATEST).
+    """
+
+    def __init__(self, writer, model_dir=model_store.MODEL_DIR, version=None, anomalies_only=True,
+                 commit_seconds=COMMIT_SECONDS, update=False, save_every=SAVE_EVERY):
+        # A model that keeps learning needs writable arrays, not the read-only memory map
+        self.model, metadata = model_store.load_model(model_dir, version, mmap_mode=None if update else 'r')
+        if update and not hasattr(self.model, 'partial_fit'):
+            raise ValueError(f"{metadata['model_class']} can't be updated incrementally; "
+                             "train with --detector half_space_trees")
+        self.encoder = model_store.load_encoder(metadata)
+        self.version = metadata['version']
+        self.model_dir = model_dir
+        self.writer = writer
+        self.anomalies_only = anomalies_only
+        self.commit_seconds = commit_seconds
+        self.update = update
+        self.save_every = save_every
+        self.rows = 0
+        self.anomalies = 0
+        self._unsaved_rows = 0
+        self._last_commit = time.monotonic()
+
+    def score(self, batch):
+        if batch.empty:
+            # An idle tick from iter_ndjson_batches: nothing to score, maybe something to commit
+            self.commit_if_due()
+            return
+        scored = score_chunk(self.model, self.encoder, batch)
+        flagged = scored['is_anomaly'] == 'Anomaly'
+        self.writer.write(scored[flagged] if self.anomalies_only else scored)
+        self.rows += len(scored)
+        self.anomalies += int(flagged.sum())
+        if self.update:
+            X, _ = self.encoder.encode_frame(batch, dtype=np.float32)
+            self.model.partial_fit(X)
+            self._unsaved_rows += len(X)
+            if self.save_every and self._unsaved_rows >= self.save_every:
+                self.save_model()
+        self.commit_if_due()
+
+    def commit_if_due(self):
+        if time.monotonic() - self._last_commit >= self.commit_seconds:
+            self.commit()
+
+    def save_model(self):
+        """Save the updated model as a new version, derived from the one it was loaded as."""
+        if not self._unsaved_rows:
+            return
+        # Timestamp versions have one-second resolution; saves can come faster
+        version = base = model_store.new_version()
+        suffix = 0
+        while os.path.exists(os.path.join(self.model_dir, version)):
+            suffix += 1
+            version = f'{base}-{suffix}'
+        path = model_store.save_model(self.model, self.encoder, {
+            'training_source': 'stream_score.py --update',
+            'base_version': self.version,
+            'n_samples_streamed': self._unsaved_rows,
+        }, model_dir=self.model_dir, version=version)
+        print(f"💾 Updated model saved to {path}", flush=True)
+        self.version = os.path.basename(path)
+        self._unsaved_rows = 0
+
+    def commit(self):
+        if self.writer.pending_rows:
+            print(f"  {self.rows:,} transactions scored, {self.anomalies:,} anomalies", flush=True)
+        self.writer.commit()
+        self._last_commit = time.monotonic()
+
+    def consume(self, batches):
+        for batch in batches:
+            self.score(batch)
+
+
+def load_processed(store):
+    path = os.path.join(store, STATE_FILE)
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return set(json.load(f)['processed'])
+
+
+def save_processed(store, processed):
+    tmp = os.path.join(store, STATE_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump({'processed': sorted(processed)}, f, indent=2)
+    os.replace(tmp, os.path.join(store, STATE_FILE))
+
+
+def watch_directory(scorer, directory, store, batch_size=BATCH_SIZE, poll_seconds=POLL_SECONDS):
+    """
+    Score every file that appears in directory, in name order, forever.
+    Producers should move finished files in (rename) rather than write them
+    in place. A file is recorded as done only after its rows are committed,
+    so a restart never skips one.
+    """
+    processed = load_processed(store)
+    while True:
+        new_files = sorted(name for name in os.listdir(directory)
+                           if name.endswith(INPUT_EXTENSIONS) and name not in processed)
+        for name in new_files:
+            print(f"📥 {name}")
+            scorer.consume(iter_file_batches(os.path.join(directory, name), batch_size))
+            scorer.commit()
+            processed.add(name)
+            save_processed(store, processed)
+        time.sleep(poll_seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Continuously score transactions into a partitioned store")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--input', default='-',
+                        help="NDJSON, CSV or Parquet file to score, or - for NDJSON on stdin (default)")
+    source.add_argument('--watch', help="Directory to poll for new NDJSON/CSV/Parquet files")
+    parser.add_argument('--output-dir', default='.', help=f"Where the {STORE_NAME}/ store lives")
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet', help="Part file format")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Transactions per model call")
+    parser.add_argument('--rows-per-part', type=int, default=ROWS_PER_PART, help="Rows per part file")
+    parser.add_argument('--max-wait', type=float, default=MAX_WAIT_SECONDS,
+                        help="Seconds before a partial stdin batch is scored")
+    parser.add_argument('--commit-seconds', type=float, default=COMMIT_SECONDS,
+                        help="Seconds between commits of the open part file")
+    parser.add_argument('--poll-seconds', type=float, default=POLL_SECONDS, help="--watch polling interval")
+    parser.add_argument('--all-rows', action='store_true', help="Store normal rows too, not only anomalies")
+    parser.add_argument('--update', action='store_true',
+                        help="Keep training an online model (half_space_trees) on every scored batch")
+    parser.add_argument('--save-every', type=int, default=SAVE_EVERY,
+                        help="With --update, transactions between saves of the updated model (0: only at exit)")
+    parser.add_argument('--model-dir', default=model_store.MODEL_DIR)
+    parser.add_argument('--version', help="Model version (default: LATEST)")
+    args = parser.parse_args(argv)
+
+    store = os.path.join(args.output_dir, STORE_NAME)
+    os.makedirs(store, exist_ok=True)
+    with PartitionedWriter(store, args.format, args.rows_per_part) as writer:
+        scorer = StreamScorer(writer, args.model_dir, args.version, not args.all_rows, args.commit_seconds,
+                              args.update, args.save_every)
+        mode = ", updating the model" if args.update else ""
+        print(f"🔁 Scoring with model {scorer.version} into {store}/ (batches of {args.batch_size:,}{mode})")
+        start = time.perf_counter()
+        try:
+            if args.watch:
+                watch_directory(scorer, args.watch, store, args.batch_size, args.poll_seconds)
+            elif args.input == '-':
+                idle = min(args.max_wait, args.commit_seconds)
+                scorer.consume(iter_ndjson_batches(sys.stdin, args.batch_size, args.max_wait, idle))
+            else:
+                scorer.consume(iter_file_batches(args.input, args.batch_size))
+        except KeyboardInterrupt:
+            print("\nStopping; committing the open part...")
+        if args.update:
+            scorer.save_model()
+        elapsed = time.perf_counter() - start
+
+    print(f"\n✅ Scored {scorer.rows:,} transactions in {elapsed:.1f}s "
+          f"({scorer.rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    print(f"📊 {scorer.anomalies:,} anomalies; {writer.rows:,} rows appended to {store}/ "
+          f"in {writer.parts} part files")
+
+
+if __name__ == "__main__":
+    main()
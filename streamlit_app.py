@@ -1,51 +1,98 @@
+import io
+import math
+
 import streamlit as st
-import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
-# Load data
-@st.cache_data
-def load_data():
-    return pd.read_csv("anomalies_detected.csv")
+from anomaly_store import PAGE_SIZE, STORE_DIR, AnomalyStore, box_stats, build_store, is_stale, source_version
+from data_io import table_path
+
+# Source table: anomalies_detected.parquet if present, else the CSV
+SOURCE = table_path(".", "anomalies_detected")
+
+
+# Load data through the sorted, agency-partitioned store (rebuilt when the source changes).
+# Filters are pushed down to it, so no rerun touches every row.
+@st.cache_resource
+def load_store(version):
+    if is_stale(STORE_DIR, SOURCE):
+        build_store(SOURCE, STORE_DIR)
+    return AnomalyStore(STORE_DIR)
+
+
+# Charts are drawn from the store's per-agency amount histograms, not the rows,
+# and the rendered images are cached per dataset version and filter state
+def render_png(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
 
-df = load_data()
+
+@st.cache_data(max_entries=256)
+def distribution_chart(_store, version, agencies, amount_min, amount_max):
+    centres, counts = _store.histogram(agencies, amount_min, amount_max)
+    present = counts > 0
+    fig, ax = plt.subplots(figsize=(10, 5))
+    if present.any():
+        binrange = (centres[present].min(), centres[present].max())
+        sns.histplot(x=centres[present], weights=counts[present], bins=30, binrange=binrange, kde=True, ax=ax)
+    ax.set_xlabel("Amount")
+    ax.set_ylabel("Frequency")
+    return render_png(fig)
+
+
+@st.cache_data(max_entries=256)
+def agency_chart(_store, version, agencies, amount_min, amount_max):
+    stats = []
+    for agency in agencies:
+        centres, counts = _store.histogram([agency], amount_min, amount_max)
+        box = box_stats(centres, counts, label=agency)
+        if box is not None:
+            stats.append(box)
+    fig, ax = plt.subplots(figsize=(10, 5))
+    if stats:
+        palette = sns.color_palette(n_colors=len(stats))
+        parts = ax.bxp(stats, showfliers=False, patch_artist=True, widths=0.8, medianprops={"color": "0.2"})
+        for patch, color in zip(parts["boxes"], palette):
+            patch.set_facecolor(color)
+    ax.set_xlabel("agency")
+    ax.set_ylabel("amount")
+    plt.xticks(rotation=45)
+    return render_png(fig)
+
+
+store = load_store(source_version(SOURCE))
 
 # Sidebar filters
 st.sidebar.header("Filter Anomalies")
-agencies = df["agency"].unique()
+agencies = store.agencies
 selected_agencies = st.sidebar.multiselect("Select Agencies", agencies, default=agencies)
 
-min_amount = float(df["amount"].min())
-max_amount = float(df["amount"].max())
+min_amount, max_amount = (float(x) for x in store.amount_range)
 amount_range = st.sidebar.slider("Amount Range", min_value=min_amount, max_value=max_amount,
                                  value=(min_amount, max_amount))
 
 # Apply filters
-filtered_df = df[
-    (df["agency"].isin(selected_agencies)) &
-    (df["amount"] >= amount_range[0]) &
-    (df["amount"] <= amount_range[1])
-]
+n_filtered = store.count(selected_agencies, *amount_range)
 
 # Main app
 st.title("💰 Government Spending Anomaly Detection")
 st.markdown("This dashboard visualizes anomalies in government payment data using Isolation Forest.")
 
 st.subheader("📊 Filtered Anomalies")
-st.write(f"Showing {len(filtered_df)} anomalies:")
-st.dataframe(filtered_df)
+n_pages = max(1, math.ceil(n_filtered / PAGE_SIZE))
+page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1)
+st.write(f"Showing {n_filtered} anomalies (page {page} of {n_pages}, sorted by agency and amount):")
+st.dataframe(store.page(selected_agencies, *amount_range, page=page - 1))
+
+chart_filters = (store.version, tuple(selected_agencies), *amount_range)
 
 # Distribution plot
 st.subheader("📈 Anomaly Amount Distribution")
-fig, ax = plt.subplots(figsize=(10, 5))
-sns.histplot(filtered_df["amount"], bins=30, kde=True, ax=ax)
-ax.set_xlabel("Amount")
-ax.set_ylabel("Frequency")
-st.pyplot(fig)
+st.image(distribution_chart(store, *chart_filters))
 
 # Agency-wise boxplot
 st.subheader("🏛️ Agency-wise Spending")
-fig2, ax2 = plt.subplots(figsize=(10, 5))
-sns.boxplot(data=filtered_df, x="agency", y="amount", ax=ax2)
-plt.xticks(rotation=45)
-st.pyplot(fig2)
+st.image(agency_chart(store, *chart_filters))
@@ -0,0 +1,113 @@
+"""
+Synthetic payment transactions at any scale, for training, demos and the
+benchmark suite (benchmarks/run_benchmarks.py).
+
+Rows follow the notebook's simulated layout (agency, recipient_type,
+amount, payment_date). They are generated and written chunk by chunk, so
+100M rows need no more memory than one chunk. Each chunk has its own seed
+derived from (seed, chunk index), so a given seed and chunksize always
+produce the same file.
+
+    python synthetic_data.py --rows 10000000 --output transactions.parquet --anomaly-rate 0.01
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_io import ChunkWriter, CHUNKSIZE
+
+AGENCIES = ['Health', 'Education', 'Defence', 'Infrastructure']
+RECIPIENT_TYPES = ['Company', 'Non-profit', 'Individual']
+
+# Payment dates are drawn uniformly from this many days after START_DATE
+START_DATE = '2022-01-01'
+DATE_SPAN_DAYS = 3 * 365
+
+# Notebook's amount distribution
+AMOUNT_SHAPE = 2.0
+AMOUNT_SCALE = 10000.0
+
+# Injected anomalies have their amount multiplied by a factor in this range
+ANOMALY_FACTOR = (5.0, 20.0)
+
+# Ground-truth column added by labels=True
+LABEL_COLUMN = 'injected_anomaly'
+
+
+def simulate_transactions(n=1000, seed=42):
+    """Same simulated payment records as the notebook."""
+    np.random.seed(seed)
+    return pd.DataFrame({
+        "agency": np.random.choice(AGENCIES, n),
+        "recipient_type": np.random.choice(RECIPIENT_TYPES, n),
+        "amount": np.random.gamma(shape=2.0, scale=10000.0, size=n),
+        "payment_date": pd.date_range(start="2022-01-01", periods=n, freq='D')
+    })
+
+
+def generate_chunk(n, rng, anomaly_rate=0.0, labels=False):
+    """
+    n transactions from a numpy Generator. Categories are built from codes,
+    so no per-row strings are created. A share anomaly_rate of rows get
+    their amount multiplied by ANOMALY_FACTOR; labels=True marks them in
+    LABEL_COLUMN.
+    """
+    amount = rng.gamma(AMOUNT_SHAPE, AMOUNT_SCALE, n)
+    injected = rng.random(n) < anomaly_rate
+    amount[injected] *= rng.uniform(*ANOMALY_FACTOR, int(injected.sum()))
+    df = pd.DataFrame({
+        'agency': pd.Categorical.from_codes(rng.integers(0, len(AGENCIES), n), AGENCIES),
+        'recipient_type': pd.Categorical.from_codes(rng.integers(0, len(RECIPIENT_TYPES), n), RECIPIENT_TYPES),
+        'amount': amount,
+        'payment_date': pd.Timestamp(START_DATE) + pd.to_timedelta(rng.integers(0, DATE_SPAN_DAYS, n), unit='D'),
+    })
+    if labels:
+        df[LABEL_COLUMN] = injected
+    return df
+
+
+def iter_transactions(n_rows, chunksize=CHUNKSIZE, seed=42, anomaly_rate=0.0, labels=False):
+    """Yield n_rows transactions as DataFrames of at most chunksize rows."""
+    for index, start in enumerate(range(0, n_rows, chunksize)):
+        rng = np.random.default_rng([seed, index])
+        yield generate_chunk(min(chunksize, n_rows - start), rng, anomaly_rate, labels)
+
+
+def generate_transactions(n_rows, seed=42, anomaly_rate=0.0, labels=False, chunksize=CHUNKSIZE):
+    """n_rows transactions as one DataFrame (same rows as write_transactions)."""
+    chunks = list(iter_transactions(n_rows, chunksize, seed, anomaly_rate, labels))
+    if not chunks:
+        return generate_chunk(0, np.random.default_rng(seed), anomaly_rate, labels)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def write_transactions(path, n_rows, chunksize=CHUNKSIZE, seed=42, anomaly_rate=0.0, labels=False):
+    """Stream n_rows transactions to a CSV or Parquet file. Returns the rows written."""
+    with ChunkWriter(path) as writer:
+        for chunk in iter_transactions(n_rows, chunksize, seed, anomaly_rate, labels):
+            writer.write(chunk)
+    return writer.rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic payment transactions")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="Transactions to generate")
+    parser.add_argument('--output', default='transactions.parquet', help="CSV or Parquet file to write")
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help="Rows generated and written at a time")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--anomaly-rate', type=float, default=0.0,
+                        help=f"Share of rows with an amount {ANOMALY_FACTOR[0]:g}-{ANOMALY_FACTOR[1]:g}x too large")
+    parser.add_argument('--labels', action='store_true',
+                        help=f"Add a {LABEL_COLUMN} column marking the injected rows")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    rows = write_transactions(args.output, args.rows, args.chunksize, args.seed, args.anomaly_rate, args.labels)
+    elapsed = time.perf_counter() - start
+    print(f"✅ {rows:,} transactions written to {args.output} in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,36 @@ import json
 url = "http://localhost:5000/predict"
 test_data = {
     "amount": 10000,
-    "department": "IT", 
-    "category": "Unusual"
+    "agency": "Health",
+    "recipient_type": "Company",
+    "payment_date": "2024-03-16"
 }
 
 response = requests.post(url, json=test_data)
-print(f"Response: {response.json()}")
\ No newline at end of file
+print(f"Response: {response.json()}")
+
+# Test the batch endpoint (records and columnar payloads)
+batch_url = "http://localhost:5000/predict_batch"
+batch_records = [test_data, {"amount": 250, "agency": "Defence", "recipient_type": "Individual",
+                              "payment_date": "2024-03-18"}]
+response = requests.post(batch_url, json=batch_records)
+print(f"Batch response: {response.json()}")
+
+batch_columns = {
+    "amount": [10000, 250],
+    "agency": ["Health", "Defence"],
+    "recipient_type": ["Company", "Individual"],
+    "payment_date": ["2024-03-16", "2024-03-18"]
+}
+response = requests.post(batch_url, json=batch_columns)
+print(f"Columnar batch response: {response.json()}")
+
+# Unseen categories are scored as the baseline category and reported back
+response = requests.post(url, json={**test_data, "agency": "Treasury"})
+print(f"Unknown category response: {response.json()}")
+
+# Explain a transaction twice; the second call is served from the cache
+explain_url = "http://localhost:5000/explain"
+for _ in range(2):
+    response = requests.post(explain_url, json=test_data)
+    print(f"Explain response: {response.json()}")
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest
+
+import forest_evaluator
+from forest_evaluator import FlatForest
+
+
+def transactions(n, n_features=5, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, n_features))
+    X[:, 0] = rng.lognormal(8, 1, n)
+    X[: n // 50, 0] *= 20
+    return X
+
+
+@pytest.mark.parametrize('max_features', [1.0, 0.6, 2, 1])
+@pytest.mark.parametrize('max_samples', ['auto', 64, 0.5, 1])
+def test_decision_function_matches_sklearn_exactly(max_features, max_samples):
+    X = transactions(600)
+    model = IsolationForest(n_estimators=30, max_samples=max_samples, max_features=max_features,
+                            random_state=0).fit(X)
+    forest = FlatForest.from_model(model)
+    expected = model.decision_function(X)
+    np.testing.assert_array_equal(forest.decision_function(X), expected)
+    # Single rows too: their per-tree depths must be added in the same order
+    for i in range(5):
+        np.testing.assert_array_equal(forest.decision_function(X[i:i + 1]), expected[i:i + 1])
+    np.testing.assert_array_equal(forest.predict(X), model.predict(X))
+
+
+def test_matches_sklearn_across_row_blocks_and_missing_values(monkeypatch):
+    X = transactions(500)
+    model = IsolationForest(n_estimators=20, random_state=1).fit(X)
+    X[::9, 1] = np.nan
+    monkeypatch.setattr(forest_evaluator, 'BATCH_ROWS', 64)
+    np.testing.assert_array_equal(FlatForest.from_model(model).decision_function(X), model.decision_function(X))
+
+
+def test_save_and_load_round_trip(tmp_path):
+    X = transactions(300)
+    model = IsolationForest(n_estimators=10, random_state=2).fit(X)
+    path = str(tmp_path / 'forest.npz')
+    FlatForest.from_model(model).save(path)
+    np.testing.assert_array_equal(FlatForest.load(path).decision_function(X), model.decision_function(X))
+
+
+def test_cascade_flags_match_full_forest_with_a_large_margin():
+    X = transactions(800)
+    model = IsolationForest(n_estimators=40, random_state=3).fit(X)
+    forest = FlatForest.from_model(model)
+    cascade = forest_evaluator.CascadedForest(forest, first_trees=10, margin=10.0)
+    # Nothing is confidently far, so every row is finished on all trees
+    np.testing.assert_array_equal(cascade.decision_function(X), model.decision_function(X))
+    np.testing.assert_array_equal(cascade.predict(X), model.predict(X))
+    assert cascade.stats()['tree_evaluations_saved'] == 0.0
+
+    stats = forest_evaluator.evaluate_cascade(forest, X, first_trees=10, margin=10.0)
+    assert stats['agreement'] == 1.0
+    assert stats['max_score_error'] == 0.0
+
+
+def test_cascade_reports_early_exits():
+    X = transactions(800)
+    forest = FlatForest.from_model(IsolationForest(n_estimators=40, random_state=3).fit(X))
+    stats = forest_evaluator.evaluate_cascade(forest, X, first_trees=10, margin=0.02)
+    assert stats['rows'] == len(X)
+    assert 0 < stats['early_exit_rate'] <= 1
+    assert stats['tree_evaluations_saved'] == pytest.approx(stats['early_exit_rate'] * 30 / 40)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+import online_detector
+from online_detector import HalfSpaceTrees
+
+
+def transactions(n, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, 6))
+    X[:, 0] = rng.lognormal(8, 1, n)
+    return X
+
+
+def test_scores_are_deterministic():
+    X = transactions(3000)
+    first = HalfSpaceTrees(window_size=1000, random_state=7).fit(X[:2000])
+    second = HalfSpaceTrees(window_size=1000, random_state=7).fit(X[:2000])
+    np.testing.assert_array_equal(first.score_samples(X), second.score_samples(X))
+    np.testing.assert_array_equal(first.score_samples(X), first.score_samples(X))
+
+
+@pytest.mark.parametrize('block', [1, 7, 1000])
+def test_blocked_scoring_matches_unblocked(monkeypatch, block):
+    X = transactions(2500)
+    monkeypatch.setattr(online_detector, 'BATCH_ROWS', 10 ** 9)
+    whole = HalfSpaceTrees(window_size=1000, random_state=3).fit(X[:1500]).partial_fit(X[1500:])
+    expected = whole.score_samples(X)
+
+    monkeypatch.setattr(online_detector, 'BATCH_ROWS', block)
+    blocked = HalfSpaceTrees(window_size=1000, random_state=3).fit(X[:1500]).partial_fit(X[1500:])
+    np.testing.assert_array_equal(blocked.reference_mass_, whole.reference_mass_)
+    np.testing.assert_array_equal(blocked.latest_mass_, whole.latest_mass_)
+    assert blocked.offset_ == whole.offset_
+    np.testing.assert_array_equal(blocked.score_samples(X), expected)
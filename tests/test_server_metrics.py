@@ -0,0 +1,40 @@
+import threading
+
+from server_metrics import MetricsRegistry
+
+
+def run_threads(n, target):
+    for _ in range(n):
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+
+
+def test_short_lived_threads_keep_the_shard_count_bounded():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', 'Requests', ('endpoint',))
+    latency = registry.histogram('request_seconds', 'Latency', ('endpoint',))
+
+    def handle():
+        requests.inc('predict')
+        latency.observe(0.002, 'predict')
+
+    run_threads(2000, handle)
+    # Each new thread folds the exited ones, so only the latest shard is left
+    assert len(requests._shards) <= 1
+    assert len(latency._shards) <= 1
+
+    assert requests.snapshot() == [[['predict'], 2000]]
+    [[labels, counts, total, count]] = latency.snapshot()
+    assert labels == ['predict'] and count == 2000 and sum(counts) == 2000
+    assert abs(total - 4.0) < 1e-9
+    assert len(requests._shards) == 0
+
+
+def test_live_thread_shards_are_merged_with_retired_ones():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', 'Requests', ('endpoint',))
+    run_threads(10, lambda: requests.inc('predict'))
+    requests.inc('predict', amount=5)
+    assert requests.snapshot() == [[['predict'], 15]]
+    assert 'requests_total{endpoint="predict"} 15' in registry.render()
@@ -0,0 +1,55 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+import model_store
+from data_io import PartitionedWriter
+from features import FeatureEncoder
+from stream_score import StreamScorer, iter_ndjson_batches
+
+
+def transactions(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'agency': rng.choice(['Defense', 'Education', 'Health'], n),
+        'recipient_type': rng.choice(['Contractor', 'Grant'], n),
+        'amount': rng.lognormal(8, 1, n),
+        'payment_date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, n), unit='D'),
+    })
+
+
+def test_quiet_stream_commits_scored_rows(tmp_path):
+    data = transactions(200)
+    encoder = FeatureEncoder().fit(data)
+    X, _ = encoder.encode_frame(data, dtype=np.float32)
+    model = IsolationForest(n_estimators=10, random_state=0).fit(X)
+    model_dir = str(tmp_path / 'models')
+    model_store.save_model(model, encoder, model_dir=model_dir)
+
+    store = str(tmp_path / 'store')
+    os.makedirs(store)
+    read_fd, write_fd = os.pipe()
+    with PartitionedWriter(store) as writer, os.fdopen(read_fd) as stream, os.fdopen(write_fd, 'w') as feed:
+        scorer = StreamScorer(writer, model_dir, anomalies_only=False, commit_seconds=0.3)
+        batches = iter_ndjson_batches(stream, batch_size=1000, max_wait=0.05, idle=0.05)
+        consumer = threading.Thread(target=scorer.consume, args=(batches,), daemon=True)
+        consumer.start()
+
+        for record in data.head(20).to_dict('records'):
+            feed.write(json.dumps({**record, 'payment_date': record['payment_date'].isoformat()}) + '\n')
+        feed.flush()
+        # The stream stays open but quiet; the scored rows are still committed
+        deadline = time.monotonic() + 5
+        while not writer.parts and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert writer.parts == 1
+        assert writer.pending_rows == 0
+        assert [n for n in os.listdir(store) if n.startswith('part-')] == ['part-000000.parquet']
+        assert scorer.rows == 20
+        feed.close()
+        consumer.join(timeout=5)
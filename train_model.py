@@ -0,0 +1,176 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from features import FeatureEncoder, CATEGORICAL_COLUMNS, DATE_COLUMN
+from data_io import ChunkWriter, CHUNKSIZE
+from online_detector import HalfSpaceTrees
+from scoring import score_chunk, read_raw_chunks
+from synthetic_data import simulate_transactions
+import model_store
+
+# Encoded training rows kept with the artifact as the SHAP background set
+BACKGROUND_SIZE = 100
+
+# --detector choices; half_space_trees can keep learning in stream_score.py --update
+DETECTORS = {
+    'isolation_forest': IsolationForest,
+    'half_space_trees': HalfSpaceTrees,
+}
+
+
+def make_detector(detector='isolation_forest', n_estimators=None, contamination=0.05, random_state=42):
+    """Unfitted detector; n_estimators=None keeps the detector's own default."""
+    params = {'contamination': contamination, 'random_state': random_state}
+    if n_estimators:
+        params['n_estimators'] = n_estimators
+    return DETECTORS[detector](**params)
+
+
+def sample_background(X, size=BACKGROUND_SIZE, seed=42):
+    rng = np.random.default_rng(seed)
+    return X[rng.choice(len(X), min(size, len(X)), replace=False)]
+
+
+def train(data, n_estimators=None, contamination=0.05, random_state=42, detector='isolation_forest'):
+    """
+    Fit the feature encoder and the detector (IsolationForest by default) on
+    the notebook's feature layout. Returns (model, encoder, background
+    sample for SHAP).
+    """
+    encoder = FeatureEncoder().fit(data)
+    data_encoded, _ = encoder.encode_frame(data)
+    model = make_detector(detector, n_estimators, contamination, random_state)
+    model.fit(data_encoded)
+    return model, encoder, sample_background(data_encoded, seed=random_state)
+
+
+def train_chunked(path, chunksize=CHUNKSIZE, sample_size=100_000,
+                  n_estimators=None, contamination=0.05, random_state=42, detector='isolation_forest'):
+    """
+    Out-of-core training for files that don't fit in memory.
+
+    One streaming pass collects every category (for the encoder) and a
+    uniform reservoir sample of rows: each row gets a random key and the
+    `sample_size` smallest keys are kept. Each tree only draws `max_samples`
+    (256 by default) points, so fitting on the sample gives the same model
+    quality as the full file. Peak memory is about sample_size + chunksize
+    rows.
+    """
+    rng = np.random.default_rng(random_state)
+    categories = {column: set() for column in CATEGORICAL_COLUMNS}
+    sample, keys = None, None
+    n_rows = 0
+    
+    for chunk in read_raw_chunks(path, chunksize):
+        n_rows += len(chunk)
+        for column in CATEGORICAL_COLUMNS:
+            categories[column].update(chunk[column].dropna().unique())
+        
+        chunk_keys = rng.random(len(chunk))
+        if sample is None:
+            sample, keys = chunk, chunk_keys
+        else:
+            sample = pd.concat([sample, chunk], ignore_index=True)
+            keys = np.concatenate([keys, chunk_keys])
+        if len(sample) > sample_size:
+            keep = np.argpartition(keys, sample_size)[:sample_size]
+            sample, keys = sample.iloc[keep].reset_index(drop=True), keys[keep]
+        print(f"  read {n_rows:,} rows")
+    
+    if sample is None:
+        raise ValueError(f"No rows in {path}")
+    
+    encoder = FeatureEncoder().set_categories(categories)
+    sample_encoded, _ = encoder.encode_frame(sample, dtype=np.float32)
+    model = make_detector(detector, n_estimators, contamination, random_state)
+    model.fit(sample_encoded)
+    background = sample_background(sample_encoded, seed=random_state)
+    return model, encoder, background, n_rows, len(sample)
+
+
+def score_file(model, encoder, path, output, chunksize=CHUNKSIZE, anomalies_only=True):
+    """
+    Score `path` chunk by chunk and append results to `output` (CSV or
+    Parquet) in the anomalies_detected.csv layout. Returns (rows, anomalies).
+    """
+    rows = anomalies = 0
+    with ChunkWriter(output) as writer:
+        for chunk in read_raw_chunks(path, chunksize):
+            scored = score_chunk(model, encoder, chunk)
+            flagged = scored['is_anomaly'] == 'Anomaly'
+            rows += len(scored)
+            anomalies += int(flagged.sum())
+            writer.write(scored[flagged] if anomalies_only else scored)
+    return rows, anomalies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the anomaly detector and save a versioned artifact")
+    parser.add_argument('--input', help="CSV of raw transactions (agency, recipient_type, amount, payment_date). "
+                                        "Defaults to the notebook's simulated dataset.")
+    parser.add_argument('--simulate', type=int, default=1000, help="Rows to simulate when no --input is given")
+    parser.add_argument('--chunksize', type=int, help="Stream --input (CSV or Parquet) in chunks of this many rows "
+                                                      "and fit on a reservoir sample instead of loading it whole")
+    parser.add_argument('--sample-size', type=int, default=100_000, help="Reservoir sample size in chunked mode")
+    parser.add_argument('--score-output', help="In chunked mode, also score the whole input into this file "
+                                               "(e.g. anomalies_detected.csv or .parquet)")
+    parser.add_argument('--all-rows', action='store_true', help="Write normal rows to --score-output too")
+    parser.add_argument('--detector', choices=sorted(DETECTORS), default='isolation_forest',
+                        help="half_space_trees is an online model that stream_score.py --update keeps training")
+    parser.add_argument('--n-estimators', type=int,
+                        help="Trees (default: 100 for isolation_forest, 25 for half_space_trees)")
+    parser.add_argument('--contamination', type=float, default=0.05)
+    parser.add_argument('--random-state', type=int, default=42)
+    parser.add_argument('--model-dir', default=model_store.MODEL_DIR)
+    parser.add_argument('--version', help="Artifact version name (default: UTC timestamp)")
+    args = parser.parse_args(argv)
+    
+    if args.chunksize:
+        if not args.input:
+            parser.error("--chunksize requires --input")
+        print(f"Streaming {args.input} in chunks of {args.chunksize:,} rows...")
+        model, encoder, background, n_rows, n_sampled = train_chunked(
+            args.input, args.chunksize, args.sample_size,
+            args.n_estimators, args.contamination, args.random_state, args.detector)
+        path = model_store.save_model(model, encoder, {
+            'training_source': args.input,
+            'n_samples': n_rows,
+            'n_samples_fitted': n_sampled,
+        }, model_dir=args.model_dir, version=args.version, background=background)
+        print(f"\n✅ Model saved to {path} (fitted on {n_sampled:,} of {n_rows:,} rows)")
+        
+        if args.score_output:
+            print(f"Scoring {args.input} into {args.score_output}...")
+            rows, anomalies = score_file(model, encoder, args.input, args.score_output,
+                                         args.chunksize, anomalies_only=not args.all_rows)
+            print(f"📊 {anomalies:,} anomalies in {rows:,} transactions")
+        return path
+    
+    if args.input:
+        print(f"Loading transactions from {args.input}...")
+        data = pd.read_csv(args.input, parse_dates=[DATE_COLUMN])
+        source = args.input
+    else:
+        print(f"Simulating {args.simulate:,} transactions...")
+        data = simulate_transactions(args.simulate, seed=args.random_state)
+        source = 'simulated'
+    
+    print(f"Training {DETECTORS[args.detector].__name__}...")
+    model, encoder, background = train(data, args.n_estimators, args.contamination, args.random_state,
+                                       args.detector)
+    
+    path = model_store.save_model(model, encoder, {
+        'training_source': source,
+        'n_samples': len(data),
+    }, model_dir=args.model_dir, version=args.version, background=background)
+    
+    print(f"\n✅ Model saved to {path}")
+    print(f"📐 Features: {', '.join(encoder.feature_columns)}")
+    return path
+
+
+if __name__ == "__main__":
+    main()